@@ -0,0 +1,192 @@
+###############################################################################
+#                               approx_kernel.py
+#
+# Approximate RBF kernel models, Random Fourier Features or Nystroem feature
+# map followed by a linear classifier, with a fixed inference cost.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The inference cost of the SVM and of the RVM grows with the
+#              number of vectors that they keep from the train dataset. Here
+#              the 32 FFT features are mapped by a feature map of a fixed
+#              number of components D, whose dot products approximate the same
+#              RBF kernel exp(-gamma * ||x - x'||^2), and then a linear SVM
+#              (liblinear, one-vs-rest) is trained on the mapped features:
+#
+#                rff      - Random Fourier Features (Rahimi & Recht 2007),
+#                           z(x) = sqrt(2 / D) * cos(W^T x + b) with the
+#                           columns of W from N(0, 2 * gamma * I) and b
+#                           uniform in [0, 2 pi).
+#                nystroem - Nystroem method, z(x) = K(x, C) K(C, C)^(-1/2)
+#                           with D components C sampled from the train
+#                           dataset. The normalization is folded into the
+#                           linear weights, so in inference it's a kernel
+#                           expansion over the D components (exportable to C
+#                           with export_c.py).
+#
+#              The memory and time of the inference depend only on D and not
+#              on the size of the train dataset, and the training is linear
+#              in the number of train samples. With the same seed, the random
+#              directions are the same for all the gamma's of a sweep.
+#
+#              ApproxKernelSweep has the same run() of the SVM / RVM sweeps, so
+#              the gamma is selected in the same way (and with the same search
+#              strategies). inferenceCost() gives the parameter bytes (float32)
+#              and the operations per inference of these models and of the SVM
+#              / RVM, so that they can be compared.
+#
+# References:
+#   Rahimi A. and Recht B. (2007), Random Features for Large-Scale Kernel
+#   Machines.
+#   Williams C. and Seeger M. (2001), Using the Nystroem Method to Speed Up
+#   Kernel Machines.
+###############################################################################
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.svm import LinearSVC
+from sklearn.metrics import accuracy_score
+from svm_sweep import squaredDistanceMatrix
+from export_c import KernelExpansion, kernelExpansion
+from profiling import phase
+
+METHODS = ('rff', 'nystroem')
+
+class ApproxKernelClassifier(BaseEstimator, ClassifierMixin):
+    # Fitted attributes:
+    #    classes_       - The classes.
+    #    components_    - rff: (n_features, D) random directions W,
+    #                     nystroem: (D, n_features) components C.
+    #    offset_        - rff: (D,) random phases b.
+    #    normalization_ - nystroem: (D, D) K(C, C)^(-1/2).
+    #    coef_          - (n_decisions, D) weights of the mapped features
+    #                     (for nystroem already multiplied by the
+    #                     normalization, they are the weights of K(x, C)).
+    #    intercept_     - (n_decisions,) bias.
+
+    def __init__(self, method='rff', n_components=256, gamma=None, C=1.0,
+                 random_state=0, max_iter=10000):
+        self.method = method
+        self.n_components = n_components
+        self.gamma = gamma
+        self.C = C
+        self.random_state = random_state
+        self.max_iter = max_iter
+
+    def _gamma(self, numFeatures):
+        return 1.0 / numFeatures if self.gamma is None else self.gamma
+
+    def _featureMap(self, X):
+        if self.method == 'rff':
+            Z = np.dot(X, self.components_) + self.offset_
+            return np.sqrt(2.0 / self.components_.shape[1]) * np.cos(Z)
+        return np.dot(self._kernel(X), self.normalization_.T)
+
+    def _kernel(self, X):
+        return np.exp(-self.gamma_ * squaredDistanceMatrix(X, self.components_))
+
+    def fit(self, X, y):
+        if self.method not in METHODS:
+            raise ValueError("approx_kernel: unknown method '{0}'.".format(self.method))
+        X = np.asarray(X, dtype=np.float64)
+        rng = np.random.RandomState(self.random_state)
+        numSamples, numFeatures = X.shape
+        self.gamma_ = self._gamma(numFeatures)
+
+        if self.method == 'rff':
+            self.components_ = rng.normal(size=(numFeatures, self.n_components)) * np.sqrt(2.0 * self.gamma_)
+            self.offset_ = rng.uniform(0.0, 2.0 * np.pi, size=self.n_components)
+        else:
+            numComponents = min(self.n_components, numSamples)
+            self.components_ = X[np.sort(rng.choice(numSamples, numComponents, replace=False))]
+            # K(C, C)^(-1/2) with the eigen values clipped, the kernel matrix
+            # is only semi definite when there are near duplicated components.
+            S, U = np.linalg.eigh(self._kernel(self.components_))
+            S = np.maximum(S, 1e-12)
+            self.normalization_ = np.dot(U / np.sqrt(S), U.T)
+
+        clf = LinearSVC(C=self.C, random_state=self.random_state, max_iter=self.max_iter)
+        clf.fit(self._featureMap(X), y)
+        self.classes_ = clf.classes_
+        self.coef_ = clf.coef_
+        self.intercept_ = clf.intercept_
+        if self.method == 'nystroem':
+            self.coef_ = np.dot(clf.coef_, self.normalization_)
+        return self
+
+    @property
+    def numComponents(self):
+        return self.coef_.shape[1]
+
+    @property
+    def expansion(self):
+        # The Nystroem model as a kernel expansion over the components.
+        if self.method != 'nystroem':
+            raise ValueError("approx_kernel: only the nystroem model is a kernel expansion.")
+        rule = 'binary' if len(self.classes_) == 2 else 'ovr'
+        return KernelExpansion(self.components_, self.coef_, self.intercept_,
+                               self.gamma_, self.classes_, rule)
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.method == 'rff':
+            dec = np.dot(self._featureMap(X), self.coef_.T) + self.intercept_
+        else:
+            dec = np.dot(self._kernel(X), self.coef_.T) + self.intercept_
+        return dec[:, 0] if len(self.classes_) == 2 else dec
+
+    def predict(self, X):
+        dec = self.decision_function(X)
+        if len(self.classes_) == 2:
+            return self.classes_[(dec > 0).astype(np.intp)]
+        return self.classes_[np.argmax(dec, axis=1)]
+
+class ApproxKernelSweep:
+    # Each result of run() is a tuple (gamma, accTrain, accTest,
+    # numComponents, model) in the same order of gammaVals, like in
+    # svm_sweep.SVMGammaSweep.
+
+    def __init__(self, X_train, y_train, X_test, y_test, method='rff',
+                 numComponents=256, seed=0, **clfParams):
+        self.X_train = np.asarray(X_train, dtype=np.float64)
+        self.y_train = np.asarray(y_train)
+        self.X_test  = np.asarray(X_test, dtype=np.float64)
+        self.y_test  = np.asarray(y_test)
+        self.method = method
+        self.numComponents = numComponents
+        self.seed = seed
+        self.clfParams = clfParams
+
+    def run(self, gammaVals, trainIdx=None):
+        X_fit, y_fit = self.X_train, self.y_train
+        if trainIdx is not None:
+            X_fit, y_fit = self.X_train[trainIdx], self.y_train[trainIdx]
+        results = []
+        for gammaVal in gammaVals:
+            with phase('approx.fit'):
+                clf = ApproxKernelClassifier(self.method, self.numComponents, gammaVal,
+                                             random_state=self.seed, **self.clfParams).fit(X_fit, y_fit)
+            with phase('approx.predict'):
+                accTrain = accuracy_score(y_fit, clf.predict(X_fit))
+                accTest  = accuracy_score(self.y_test, clf.predict(self.X_test))
+            results.append((gammaVal, accTrain, accTest, clf.numComponents, clf))
+        return results
+
+def inferenceCost(model):
+    # Parameter bytes (float32), multiply-accumulates and non linear functions
+    # (exp or cos) per inference, of an ApproxKernelClassifier or of any model
+    # that export_c.kernelExpansion() converts (SVM, RVM, reduced set).
+    if isinstance(model, ApproxKernelClassifier) and model.method == 'rff':
+        numFeatures, numComponents = model.components_.shape
+        numDecisions = model.coef_.shape[0]
+        numParams = numFeatures * numComponents + numComponents + numDecisions * numComponents + numDecisions
+        macs = numFeatures * numComponents + numDecisions * numComponents
+    else:
+        expansion = kernelExpansion(model)
+        numComponents, numFeatures = expansion.vectors.shape
+        numDecisions = expansion.coef.shape[0]
+        numParams = numComponents * numFeatures + numDecisions * numComponents + numDecisions + 1
+        macs = numComponents * numFeatures + numDecisions * numComponents
+    return {'num_vectors': numComponents,
+            'param_bytes': 4 * numParams,
+            'macs_per_inference': macs,
+            'nonlinear_per_inference': numComponents}
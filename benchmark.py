@@ -0,0 +1,322 @@
+###############################################################################
+#                                 benchmark.py
+#
+# Benchmark and profiling of the training sweeps and of the inference, with
+# the results in JSON and a compare mode to find regressions.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: Runs the fit and predict paths of the generators (the SVM
+#              gamma sweep, the RVM gamma sweep and the approximate kernel
+#              gamma sweeps) in the embedded dataset and in synthetic datasets
+#              of numFrames frames, made from the embedded frames with noise.
+#
+#              For each case it records:
+#                - the wall time of the sweep and the time of each phase (see
+#                  profiling.py),
+#                - the peak of the memory allocated (tracemalloc) and the peak
+#                  RSS of the process (a high water mark of the whole run),
+#                - the number of support / relevance vectors (or components)
+#                  of the selected model,
+#                - the latency of the predict of a single sample (p50 / p99)
+#                  and of a batch (per frame).
+#
+#              The SVM and the RVM need full N x N kernel matrices, the cases
+#              whose estimated memory is bigger than the memory budget are
+#              skipped (and recorded as skipped), the approximate kernel
+#              models are linear in N so they run in all the sizes. The RVM is
+#              also skipped above rvmMaxTrain train frames (default 4000, the
+#              5000 frames dataset), known gap: each refresh of the Laplace
+#              approximation is O(N^2 * M_active) and one fit of 8000 train
+#              frames (the 10000 frames dataset) takes about 100 s, so the
+#              sweep would take many minutes. Use --rvm-max-train to include
+#              it.
+#
+#              The fit time is measured in a run of the sweep without
+#              tracemalloc, and the memory in a second run with it (skipped
+#              with --no-memory).
+#
+#              Usage:
+#                python benchmark.py --sizes 1000 10000 100000 --out bench.json
+#                python benchmark.py --out new.json --baseline bench.json
+#                python benchmark.py --compare bench.json new.json
+#
+#              The compare mode flags the metrics that got worse than the
+#              baseline by more than the tolerance (relative, default 25%)
+#              and exits with 1 when there are regressions.
+###############################################################################
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+import sklearn
+from sklearn.utils import shuffle
+from svm_sweep import SVMGammaSweep
+from rvm_sweep import RVMGammaSweep
+from approx_kernel import ApproxKernelSweep, inferenceCost
+from search_strategy import selectTop
+from profiling import PhaseTimer
+from dataset import loadDataset
+
+try:
+    import resource
+except ImportError:
+    resource = None    # Windows.
+
+# Metrics compared with the baseline, with the minimum absolute difference
+# that counts as a regression (below it, it's noise).
+COMPARE_METRICS = {'fit_seconds': 0.05,
+                   'peak_tracemalloc_bytes': 1024 * 1024,
+                   'predict_single_us_p50': 5.0,
+                   'predict_batch_us_per_frame': 1.0,
+                   'num_vectors': 0}
+
+# Maximum train frames of the RVM case, see the header.
+RVM_MAX_TRAIN = 4000
+
+def syntheticDataset(X, y, numFrames, noise=0.1, seed=0):
+    # numFrames frames sampled from (X, y) plus gaussian noise with noise
+    # times the standard deviation of each feature.
+    rng = np.random.RandomState(seed)
+    idx = rng.randint(0, len(X), numFrames)
+    X = np.asarray(X, dtype=np.float64)
+    X_syn = X[idx] + noise * X.std(axis=0) * rng.randn(numFrames, X.shape[1])
+    return X_syn, np.asarray(y)[idx]
+
+def splitDataset(X, y, numTest, seed=0):
+    data, target = shuffle(X, y, random_state=seed)
+    return data[:-numTest], target[:-numTest], data[-numTest:], target[-numTest:]
+
+def peakRSS():
+    # Peak resident memory of the process in bytes (None without resource).
+    if resource is None:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRSS if sys.platform == 'darwin' else maxRSS * 1024
+
+def estimatedBytes(caseName, numTrain, numTest, numComponents):
+    # Rough memory of the biggest matrices of each case.
+    if caseName == 'svm':
+        # Distances, kernel and the libsvm copy of the kernel.
+        return 8 * (3 * numTrain * numTrain + 2 * numTest * numTrain)
+    if caseName == 'rvm':
+        # Cached distances, kernel, design matrix and its square.
+        return 8 * 4 * numTrain * numTrain
+    return 8 * 3 * (numTrain + numTest) * numComponents
+
+def predictLatency(model, X, numSingle=200, batchSize=256, repeat=5):
+    # (p50, p99) of the single sample predict and the per frame time of the
+    # batched predict, in micro seconds.
+    X = np.asarray(X, dtype=np.float64)
+    times = []
+    for i in range(numSingle):
+        x = X[i % len(X)][np.newaxis]
+        startTime = time.perf_counter()
+        model.predict(x)
+        times.append(time.perf_counter() - startTime)
+    p50, p99 = np.percentile(np.array(times) * 1e6, [50, 99])
+
+    batch = X[np.arange(batchSize) % len(X)]
+    bestTime = np.inf
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        model.predict(batch)
+        bestTime = min(bestTime, time.perf_counter() - startTime)
+    return float(p50), float(p99), float(bestTime * 1e6 / batchSize)
+
+def _candidates(caseName, numCandidates):
+    if caseName == 'rvm':
+        gammaVals = [0.000001 * 2 ** i for i in range(12)]
+        idx = np.unique(np.linspace(0, len(gammaVals) - 1, numCandidates).round().astype(int))
+        return [gammaVals[i] for i in idx]
+    return list(np.linspace(0.000001, 0.000999, numCandidates))
+
+def _runSweep(caseName, X_train, y_train, X_test, y_test, paramVals, numWorkers, numComponents):
+    if caseName == 'svm':
+        with SVMGammaSweep(X_train, y_train, X_test, y_test, numWorkers=numWorkers) as sweep:
+            return sweep.run(paramVals)
+    if caseName == 'rvm':
+        return RVMGammaSweep(X_train, y_train, X_test, y_test).run(paramVals)
+    method = caseName.split('_')[1]
+    sweep = ApproxKernelSweep(X_train, y_train, X_test, y_test, method=method,
+                              numComponents=numComponents)
+    return sweep.run(paramVals)
+
+def benchmarkCase(caseName, datasetName, X_train, y_train, X_test, y_test,
+                  numCandidates=5, numWorkers=1, numComponents=32, memoryBudget=2 * 1024 ** 3,
+                  rvmMaxTrain=RVM_MAX_TRAIN, measureMemory=True):
+    # caseName is 'svm', 'rvm', 'approx_rff' or 'approx_nystroem'.
+    result = {'case': caseName, 'dataset': datasetName,
+              'num_frames': len(X_train) + len(X_test),
+              'num_train': len(X_train), 'num_test': len(X_test)}
+    neededBytes = estimatedBytes(caseName, len(X_train), len(X_test), numComponents)
+    result['estimated_bytes'] = neededBytes
+    if neededBytes > memoryBudget:
+        result['status'] = 'skipped'
+        result['reason'] = "estimated {0} MB > memory budget {1} MB".format(
+            neededBytes // 1024 ** 2, memoryBudget // 1024 ** 2)
+        return result
+    if caseName == 'rvm' and len(X_train) > rvmMaxTrain:
+        result['status'] = 'skipped'
+        result['reason'] = "{0} train frames > RVM limit {1}".format(len(X_train), rvmMaxTrain)
+        return result
+
+    paramVals = _candidates(caseName, numCandidates)
+    result['num_candidates'] = len(paramVals)
+    with PhaseTimer() as timer:
+        startTime = time.perf_counter()
+        results = _runSweep(caseName, X_train, y_train, X_test, y_test,
+                            paramVals, numWorkers, numComponents)
+        fitSeconds = time.perf_counter() - startTime
+
+    # The memory is measured in a second run of the sweep, tracemalloc slows
+    # down the allocations (about 4 times in the sweeps) and would change the
+    # fit time.
+    peakBytes = None
+    if measureMemory:
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        _runSweep(caseName, X_train, y_train, X_test, y_test,
+                  paramVals, numWorkers, numComponents)
+        peakBytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    topParam, topAccTrain, topAccTest, topNumVectors, topModel = selectTop(results)
+    cost = inferenceCost(topModel)
+    p50, p99, batchPerFrame = predictLatency(topModel, X_test)
+    result.update({'status': 'ok',
+                   'fit_seconds': fitSeconds,
+                   'fit_seconds_per_candidate': fitSeconds / len(paramVals),
+                   'phases': timer.report(),
+                   'peak_tracemalloc_bytes': peakBytes,
+                   'peak_rss_bytes': peakRSS(),
+                   'top_param': float(topParam),
+                   'acc_train': float(topAccTrain),
+                   'acc_test': float(topAccTest),
+                   'num_vectors': int(cost['num_vectors']),
+                   'param_bytes': int(cost['param_bytes']),
+                   'predict_single_us_p50': p50,
+                   'predict_single_us_p99': p99,
+                   'predict_batch_us_per_frame': batchPerFrame})
+    return result
+
+def runBenchmarks(sizes=(1000, 10000, 100000), cases=('svm', 'rvm', 'approx_rff', 'approx_nystroem'),
+                  numCandidates=5, numWorkers=1, numComponents=32, memoryBudget=2 * 1024 ** 3,
+                  rvmMaxTrain=RVM_MAX_TRAIN, testFraction=0.2, seed=0, measureMemory=True,
+                  verbose=True):
+    from svm_rvm import dataset
+    X, y = loadDataset(dataset)
+    datasets = [('embedded', splitDataset(X, y, 10, seed))]
+    for numFrames in sizes:
+        X_syn, y_syn = syntheticDataset(X, y, numFrames, seed=seed)
+        datasets.append(('synthetic', splitDataset(X_syn, y_syn, max(1, int(testFraction * numFrames)), seed)))
+
+    results = []
+    for datasetName, (X_train, y_train, X_test, y_test) in datasets:
+        for caseName in cases:
+            result = benchmarkCase(caseName, datasetName, X_train, y_train, X_test, y_test,
+                                   numCandidates, numWorkers, numComponents, memoryBudget, rvmMaxTrain,
+                                   measureMemory)
+            results.append(result)
+            if verbose:
+                printResult(result)
+
+    meta = {'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'num_candidates': numCandidates,
+            'num_workers': numWorkers,
+            'num_components': numComponents,
+            'memory_budget_bytes': memoryBudget,
+            'rvm_max_train': rvmMaxTrain,
+            'measure_memory': measureMemory}
+    return {'meta': meta, 'results': results}
+
+def printResult(result):
+    name = "{0:15s} {1:9s} {2:7d}".format(result['case'], result['dataset'], result['num_frames'])
+    if result['status'] != 'ok':
+        print("{0}  skipped: {1}".format(name, result['reason']))
+        return
+    peakBytes = result['peak_tracemalloc_bytes']
+    print("{0}  fit_s: {1:8.3f}   peak_mem_MB: {2:8.1f}   num_vectors: {3:5d}   predict_us p50: {4:8.1f}   p99: {5:8.1f}   batch_us_per_frame: {6:7.2f}".format(
+        name, result['fit_seconds'], np.nan if peakBytes is None else peakBytes / 1024.0 ** 2, result['num_vectors'],
+        result['predict_single_us_p50'], result['predict_single_us_p99'], result['predict_batch_us_per_frame']))
+
+def _resultKey(result):
+    return (result['case'], result['dataset'], result['num_frames'])
+
+def compareResults(baseline, current, tolerance=0.25):
+    # List of the regressions, dicts with the case key, the metric, the
+    # baseline and current values and the ratio current / baseline.
+    baseResults = {_resultKey(r): r for r in baseline['results'] if r['status'] == 'ok'}
+    regressions = []
+    for result in current['results']:
+        base = baseResults.get(_resultKey(result))
+        if base is None or result['status'] != 'ok':
+            continue
+        for metric, minDiff in COMPARE_METRICS.items():
+            baseVal, currVal = base.get(metric), result.get(metric)
+            if baseVal is None or currVal is None:
+                continue
+            if currVal > baseVal * (1.0 + tolerance) and currVal - baseVal > minDiff:
+                regressions.append({'case': _resultKey(result), 'metric': metric,
+                                    'baseline': baseVal, 'current': currVal,
+                                    'ratio': currVal / baseVal if baseVal > 0 else np.inf})
+    return regressions
+
+def printRegressions(regressions, tolerance):
+    if len(regressions) == 0:
+        print("benchmark: no regressions (tolerance {0:.0%}).".format(tolerance))
+        return
+    for r in regressions:
+        print("REGRESSION {0} {1}: {2:.6g} --> {3:.6g}   ({4:.2f}x)".format(
+            ' '.join(str(k) for k in r['case']), r['metric'], r['baseline'], r['current'], r['ratio']))
+
+def _loadJSON(fileName):
+    with open(fileName, 'r') as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the SVM / RVM / approximate kernel sweeps and inference.")
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000],
+                        help="number of frames of the synthetic datasets")
+    parser.add_argument('--cases', nargs='*', default=['svm', 'rvm', 'approx_rff', 'approx_nystroem'])
+    parser.add_argument('--candidates', type=int, default=5, help="hyper-parameter values per sweep")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes of the SVM sweep")
+    parser.add_argument('--components', type=int, default=32, help="components of the approximate kernel models")
+    parser.add_argument('--memory-budget-mb', type=int, default=2048)
+    parser.add_argument('--rvm-max-train', type=int, default=RVM_MAX_TRAIN, help="maximum train frames of the RVM case")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="don't run the sweeps a second time to measure the memory")
+    parser.add_argument('--out', default='benchmark.json', help="JSON file of the results")
+    parser.add_argument('--baseline', help="JSON file of a previous run to compare with")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="only compare 2 JSON files of results")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        baseline, current = _loadJSON(args.compare[0]), _loadJSON(args.compare[1])
+    else:
+        current = runBenchmarks(args.sizes, args.cases, args.candidates, args.workers,
+                                args.components, args.memory_budget_mb * 1024 ** 2, args.rvm_max_train,
+                                measureMemory=not args.no_memory)
+        with open(args.out, 'w') as f:
+            json.dump(current, f, indent=2)
+        print("benchmark: results in {0}".format(args.out))
+        if args.baseline is None:
+            return 0
+        baseline = _loadJSON(args.baseline)
+
+    regressions = compareResults(baseline, current, args.tolerance)
+    printRegressions(regressions, args.tolerance)
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
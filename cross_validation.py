@@ -0,0 +1,193 @@
+###############################################################################
+#                             cross_validation.py
+#
+# Batched k-fold cross validation of the SVM and RVM gamma, with the fold
+# kernels sliced from one precomputed distance matrix.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The selection of the model with only one split (the last 10
+#              shuffled samples are the test dataset) depends a lot on the
+#              shuffle lottery, see the README. Here every candidate gamma of
+#              the SVM or of the RVM is evaluated in every fold of a
+#              stratified k-fold (or repeated stratified k-fold).
+#
+#              The squared distances of all the samples are computed only once,
+#              the train x train and test x train matrices of each fold are
+#              slices of it. The jobs (fold x chunk of candidates for the SVM,
+#              fold x all the gamma's for the RVM, so that the RVM sweep is
+#              warm started like in rvm_sweep.py) run in a pool of worker
+#              processes that is shared by the SVM and the RVM and that
+#              receives the distances only once. The total work is the number
+#              of folds times the one of the single split, so it takes about
+#              the same time as the single split sweep only with about as many
+#              workers (cores) as folds.
+#
+#              The result is a CVResults with compact arrays of the train and
+#              test accuracy and of the number of support (relevance) vectors
+#              per class, of shape (numFolds, numCandidates[, numClasses]),
+#              and the selection uses the same rule of the generators with the
+#              mean over the folds.
+###############################################################################
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.model_selection import StratifiedKFold, RepeatedStratifiedKFold
+from sklearn.metrics import accuracy_score
+from svm_sweep import squaredDistanceMatrix, defaultNumWorkers, _fitGammaCandidate
+from search_strategy import selectTop, selectionKey, MAX_ACC_DELTA
+from fast_rvm import RVC
+from profiling import phase
+
+def cvFolds(y, numFolds=5, numRepeats=1, seed=0):
+    # List of (trainIdx, testIdx) of a stratified k-fold, repeated numRepeats
+    # times with different shuffles.
+    if numRepeats > 1:
+        splitter = RepeatedStratifiedKFold(n_splits=numFolds, n_repeats=numRepeats, random_state=seed)
+    else:
+        splitter = StratifiedKFold(n_splits=numFolds, shuffle=True, random_state=seed)
+    return list(splitter.split(np.zeros(len(y)), y))
+
+class CVResults:
+
+    def __init__(self, paramVals, accTrain, accTest, numVectors):
+        self.paramVals  = np.asarray(paramVals)
+        self.accTrain   = accTrain    # (numFolds, numCandidates)
+        self.accTest    = accTest     # (numFolds, numCandidates)
+        self.numVectors = numVectors  # (numFolds, numCandidates, numClasses)
+
+    def meanAccTrain(self):
+        return self.accTrain.mean(axis=0)
+
+    def meanAccTest(self):
+        return self.accTest.mean(axis=0)
+
+    def select(self):
+        # Index of the candidate selected with the rule of the generators
+        # (small delta while maximizing the train accuracy) in the means.
+        # When no candidate has a delta below the maximum the rule would
+        # keep the first one, then the best selectionKey() is taken.
+        results = [(i, accTrain, accTest) for i, (accTrain, accTest)
+                   in enumerate(zip(self.meanAccTrain(), self.meanAccTest()))]
+        if all(abs(accTrain - accTest) >= MAX_ACC_DELTA for i, accTrain, accTest in results):
+            return max(results, key=lambda r: selectionKey(r[1], r[2]))[0]
+        return selectTop(results)[0]
+
+# Worker process state, filled once by the pool initializer.
+_cvState = {}
+
+def _initCV(D, y, folds):
+    _cvState['D'] = D
+    _cvState['y'] = y
+    _cvState['folds'] = folds
+
+def _foldDistances(D, folds, foldIdx):
+    trainIdx, testIdx = folds[foldIdx]
+    return D[np.ix_(trainIdx, trainIdx)], D[np.ix_(testIdx, trainIdx)], trainIdx, testIdx
+
+def _svmJob(foldIdx, gammaVals, svcParams, state=None):
+    s = _cvState if state is None else state
+    D_train, D_test, trainIdx, testIdx = _foldDistances(s['D'], s['folds'], foldIdx)
+    y = s['y']
+    results = []
+    for gammaVal in gammaVals:
+        gammaVal, accTrain, accTest, numSupportVectors, clf = _fitGammaCandidate(
+            gammaVal, D_train, D_test, y[trainIdx], y[testIdx], svcParams)
+        results.append((accTrain, accTest, numSupportVectors))
+    return foldIdx, results
+
+def _rvmJob(foldIdx, gammaVals, rvcParams, state=None):
+    s = _cvState if state is None else state
+    D_train, D_test, trainIdx, testIdx = _foldDistances(s['D'], s['folds'], foldIdx)
+    y = s['y']
+    # Warm started from the biggest to the smallest gamma, see rvm_sweep.py.
+    order = sorted(range(len(gammaVals)), key=lambda i: -gammaVals[i])
+    results = [None] * len(gammaVals)
+    clf = RVC(kernel='precomputed', warm_start=True, **rvcParams)
+    for i in order:
+        K_train = np.exp(-gammaVals[i] * D_train)
+        K_test  = np.exp(-gammaVals[i] * D_test)
+        clf.fit(K_train, y[trainIdx])
+        accTrain = accuracy_score(y[trainIdx], clf.predict(K_train))
+        accTest  = accuracy_score(y[testIdx], clf.predict(K_test))
+        results[i] = (accTrain, accTest, clf.n_relevance_.copy())
+    return foldIdx, results
+
+class CrossValidation:
+    # Holds the distance matrix of all the samples, the folds and a (lazily
+    # created) pool of worker processes, used as a context manager:
+    #
+    #    with CrossValidation(X, y, numFolds=5, numRepeats=2, numWorkers=4) as cv:
+    #        svmResults = cv.svm(gammaVals)
+    #        rvmResults = cv.rvm(gammaVals)
+    #        topGamma = svmResults.paramVals[svmResults.select()]
+
+    def __init__(self, X, y, numFolds=5, numRepeats=1, seed=0, numWorkers=None,
+                 chunkSize=None):
+        self.X = np.asarray(X, dtype=np.float64)
+        self.y = np.asarray(y)
+        self.classes = np.unique(self.y)
+        self.folds = cvFolds(self.y, numFolds, numRepeats, seed)
+        with phase('cv.distances'):
+            self.D = squaredDistanceMatrix(self.X, self.X)
+        self.numWorkers = defaultNumWorkers() if numWorkers is None else max(1, int(numWorkers))
+        self.chunkSize = chunkSize
+        self._state = {'D': self.D, 'y': self.y, 'folds': self.folds}
+        self._pool = None
+
+    def _getPool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.numWorkers, initializer=_initCV,
+                                             initargs=(self.D, self.y, self.folds))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _run(self, jobFunc, jobs):
+        if self.numWorkers == 1:
+            return [jobFunc(*job, state=self._state) for job in jobs]
+        futures = [self._getPool().submit(jobFunc, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+    def _collect(self, paramVals, jobResults, offsets):
+        numFolds, numCand = len(self.folds), len(paramVals)
+        accTrain = np.zeros((numFolds, numCand))
+        accTest  = np.zeros((numFolds, numCand))
+        numVectors = np.zeros((numFolds, numCand, len(self.classes)), dtype=np.intp)
+        for (foldIdx, results), offset in zip(jobResults, offsets):
+            for i, (a, b, n) in enumerate(results):
+                accTrain[foldIdx, offset + i] = a
+                accTest[foldIdx, offset + i]  = b
+                n = np.asarray(n)
+                numVectors[foldIdx, offset + i, :len(n)] = n
+        return CVResults(paramVals, accTrain, accTest, numVectors)
+
+    def svm(self, gammaVals, **svcParams):
+        gammaVals = [float(g) for g in gammaVals]
+        chunkSize = self.chunkSize
+        if chunkSize is None:
+            numJobs = 4 * self.numWorkers
+            chunkSize = max(1, (len(gammaVals) * len(self.folds)) // numJobs)
+        jobs, offsets = [], []
+        for foldIdx in range(len(self.folds)):
+            for start in range(0, len(gammaVals), chunkSize):
+                jobs.append((foldIdx, gammaVals[start:start + chunkSize], svcParams))
+                offsets.append(start)
+        with phase('cv.svm'):
+            return self._collect(gammaVals, self._run(_svmJob, jobs), offsets)
+
+    def rvm(self, gammaVals, **rvcParams):
+        # The alpha of the RVC is only the initial precision of the bias, the
+        # candidates are the gamma's of the RBF kernel.
+        gammaVals = [float(g) for g in gammaVals]
+        jobs = [(foldIdx, gammaVals, rvcParams) for foldIdx in range(len(self.folds))]
+        with phase('cv.rvm'):
+            return self._collect(gammaVals, self._run(_rvmJob, jobs), [0] * len(jobs))
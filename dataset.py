@@ -0,0 +1,136 @@
+###############################################################################
+#                                  dataset.py
+#
+# Streaming parser and binary cache of the FFT frames dataset.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The dataset has the format of the Eloquent Arduino
+#              voice_fft_dataset.py, a line with the class label followed
+#              by the lines of the FFT frames of that class, one frame per
+#              line with the values separated by commas:
+#
+#                  // 1
+#                  -10.00,-11.00,-14.31, ... ,-123.71
+#                  ...
+#                  // 6
+#                  ...
+#
+#              The parser reads the lines from a file or from any iterable
+#              of lines (for example the dataset string in svm_rvm.py) in
+#              chunks, each chunk is converted at once with np.loadtxt. The
+#              labels can be any integer, not only one digit, and any other
+#              '//' line (a comment) raises a ValueError with the line number.
+#
+#              loadDataset() with a cacheDir writes the parsed dataset to a
+#              binary cache (.npy files named with the hash of the content of
+#              the source), the next runs load it memory mapped, so there is
+#              no parsing at all. The frames can be stored in float32 to use
+#              half of the memory.
+###############################################################################
+
+import os
+import hashlib
+import numpy as np
+
+def _isTextSource(source):
+    return isinstance(source, str) and '\n' in source
+
+def _iterLines(source):
+    if _isTextSource(source):
+        for line in source.splitlines():
+            yield line
+    elif isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, 'r') as f:
+            for line in f:
+                yield line
+    else:
+        for line in source:
+            yield line
+
+def _parseLabel(line):
+    # '// 6' --> 6, a '//' line that is not a label returns None.
+    try:
+        return int(line[2:].strip())
+    except ValueError:
+        return None
+
+def iterFrameChunks(source, chunkSize=4096, dtype=np.float64):
+    # Yields tuples (X_chunk, y_chunk) with at most chunkSize frames.
+    label = None
+    labels = []
+    lines  = []
+
+    def convert():
+        X_chunk = np.loadtxt(lines, delimiter=',', dtype=dtype, ndmin=2)
+        y_chunk = np.array(labels, dtype=np.float64)
+        del lines[:]
+        del labels[:]
+        return X_chunk, y_chunk
+
+    for lineNum, line in enumerate(_iterLines(source), 1):
+        line = line.strip()
+        if len(line) == 0:
+            continue
+        if line.startswith('//'):
+            # A '//' line that is not a label is an error, skipping it would
+            # give the label of the previous class to the next frames.
+            label = _parseLabel(line)
+            if label is None:
+                raise ValueError("dataset: line {0} '{1}' is not a '// <label>' line.".format(lineNum, line))
+            continue
+        if label is None:
+            raise ValueError("dataset: line {0} has a frame before any '// <label>' line.".format(lineNum))
+        lines.append(line)
+        labels.append(label)
+        if len(lines) >= chunkSize:
+            yield convert()
+    if len(lines) > 0:
+        yield convert()
+
+def parseDataset(source, chunkSize=4096, dtype=np.float64):
+    # Returns (X, y), the frames and the class of each frame.
+    chunks = list(iterFrameChunks(source, chunkSize, dtype))
+    if len(chunks) == 0:
+        return np.zeros((0, 0), dtype=dtype), np.zeros(0)
+    X = np.concatenate([X_chunk for X_chunk, y_chunk in chunks])
+    y = np.concatenate([y_chunk for X_chunk, y_chunk in chunks])
+    return X, y
+
+def sourceHash(source, blockSize=1024 * 1024):
+    # sha256 of the content of the file or of the dataset text.
+    h = hashlib.sha256()
+    if _isTextSource(source):
+        h.update(source.encode('utf-8'))
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(blockSize), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def _saveArray(fileName, array):
+    # Write to a temporary file and rename it, so that a run that is stopped
+    # in the middle never leaves a broken cache file.
+    tmpName = fileName + '.tmp'
+    with open(tmpName, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmpName, fileName)
+
+def loadDataset(source, cacheDir=None, dtype=np.float64, chunkSize=4096):
+    # source is the path of a dataset file, the dataset text, or an iterable
+    # of lines. With a cacheDir (only for a file or text source) the parsed
+    # dataset is kept in binary .npy files and loaded memory mapped (read
+    # only) in the next runs.
+    dtype = np.dtype(dtype)
+    isIterable = not (_isTextSource(source) or isinstance(source, (str, bytes, os.PathLike)))
+    if cacheDir is None or isIterable:
+        return parseDataset(source, chunkSize, dtype)
+
+    baseName = os.path.join(cacheDir, "fft_dataset_{0}_{1}".format(sourceHash(source)[:32], dtype.name))
+    fileX = baseName + '_X.npy'
+    fileY = baseName + '_y.npy'
+    if not (os.path.exists(fileX) and os.path.exists(fileY)):
+        X, y = parseDataset(source, chunkSize, dtype)
+        os.makedirs(cacheDir, exist_ok=True)
+        _saveArray(fileX, X)
+        _saveArray(fileY, y)
+    return np.load(fileX, mmap_mode='r'), np.load(fileY, mmap_mode='r')
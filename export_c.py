@@ -0,0 +1,474 @@
+###############################################################################
+#                                 export_c.py
+#
+# Quantized fixed point C exporter of the SVM / RVM models, with a NumPy
+# emulator of the exact same arithmetic.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The point of this study is the inference in micro-controllers.
+#              Both the SVM and the RVM with a RBF kernel are, in inference,
+#              a kernel expansion over a set of vectors (support or relevance
+#              vectors):
+#
+#                 dec_p(x) = sum_m coef[p][m] * exp(-gamma * ||x - v_m||^2) + b_p
+#
+#              The SVM multiclass is one-vs-one (each decision votes in one
+#              of 2 classes) and the RVM multiclass is one-vs-rest (the class
+#              with the biggest decision), binary models use the sign.
+#
+#              The exporter writes a self contained C header / source pair in
+#              3 variants:
+#
+#                int8    - Vectors and input in int8, distances in int32.
+#                int16   - Vectors and input in int16, distances in int64.
+#                float32 - Everything in float32.
+#
+#              In the int variants the input is quantized with a per feature
+#              offset and a single scale (the distances only depend on the
+#              differences so the offset is free), the kernel exp() comes
+#              from 2 small lookup tables in Q15, indexed by the high and low
+#              bits of the integer distance shifted right (exp(-a - b) =
+#              exp(-a) * exp(-b), so 2 tables of 64 entries have the
+#              resolution of one of 4096), and the coefficients are int16
+#              with int64 accumulation.
+#              In the float32 variant the exp() is a fast approximation,
+#              2^x with the integer part in the exponent bits and a degree 3
+#              polynomial for the fractional part.
+#
+#              The vectors are stored one after the other with each row padded
+#              with zeros to a multiple of 16 bytes and aligned, so that the
+#              inner distance loop can be done with SIMD instructions.
+#
+#              QuantizedModel.predict() emulates in NumPy the same integer
+#              (or float32) operations, in the same order, of the C code, so
+#              the accuracy loss of the quantization, the flash and RAM bytes
+#              and the multiply-accumulates per inference can be known without
+#              flashing the hardware. For the float32 variant compile with
+#              -ffp-contract=off, so that the compiler doesn't fuse the
+#              multiply-add's (that would change the last bit).
+###############################################################################
+
+import os
+import numpy as np
+from sklearn.metrics import accuracy_score
+from svm_sweep import squaredDistanceMatrix
+
+VARIANTS = ('int8', 'int16', 'float32')
+
+# Coefficients of 2^f ~= 1 + f * (C1 + f * (C2 + f * C3)) for f in [0, 1).
+FAST_EXP2_C1 = np.float32(0.6958335)
+FAST_EXP2_C2 = np.float32(0.2251019)
+FAST_EXP2_C3 = np.float32(0.0790768)
+LOG2_E = np.float32(1.44269504)
+
+# The kernel values in the int variants are Q15 (1.0 == 32768).
+KERNEL_ONE = 32768
+
+class KernelExpansion:
+    # The float (float64) reference of the models in the form above.
+    # rule is 'ovo' (with pairs of class indexes), 'ovr' or 'binary'.
+
+    def __init__(self, vectors, coef, intercept, gamma, classes, rule, pairs=None):
+        self.vectors   = np.asarray(vectors, dtype=np.float64)
+        self.coef      = np.atleast_2d(np.asarray(coef, dtype=np.float64))
+        self.intercept = np.asarray(intercept, dtype=np.float64).reshape(-1)
+        self.gamma     = float(gamma)
+        self.classes   = np.asarray(classes)
+        self.rule      = rule
+        self.pairs     = pairs
+
+    @property
+    def numVectors(self):
+        return self.vectors.shape[0]
+
+    def decision_function(self, X):
+        K = np.exp(-self.gamma * squaredDistanceMatrix(X, self.vectors))
+        return np.dot(K, self.coef.T) + self.intercept
+
+    def predict(self, X):
+        return self.classes[decisionRule(self.decision_function(X), self.rule,
+                                         self.pairs, len(self.classes))]
+
+def decisionRule(dec, rule, pairs, numClasses):
+    # Index of the predicted class from the decisions (n_samples, n_dec).
+    if rule == 'binary':
+        return (dec[:, 0] > 0).astype(np.intp)
+    if rule == 'ovr':
+        return np.argmax(dec, axis=1)
+    votes = np.zeros((dec.shape[0], numClasses), dtype=np.intp)
+    rows = np.arange(dec.shape[0])
+    for p, (i, j) in enumerate(pairs):
+        winner = np.where(dec[:, p] > 0, i, j)
+        votes[rows, winner] += 1
+    return np.argmax(votes, axis=1)
+
+def kernelExpansion(model):
+    # Converts a fitted RBF SVC (or PrecomputedRBFSVC) or fast_rvm.RVC to a
+    # KernelExpansion.
+    if isinstance(model, KernelExpansion):
+        return model
+    if hasattr(model, 'expansion'):
+        return model.expansion
+    if getattr(model, 'kernel', 'rbf') != 'rbf':
+        raise ValueError("export_c: only the RBF kernel is supported.")
+
+    if hasattr(model, 'relevance_vectors_'):
+        # RVM, one-vs-rest or binary.
+        gamma = model._gamma(model.relevance_vectors_.shape[1])
+        rule = 'binary' if len(model.classes_) == 2 else 'ovr'
+        return KernelExpansion(model.relevance_vectors_, model.coef_,
+                               model.intercept_, gamma, model.classes_, rule)
+
+    # SVM, libsvm one-vs-one with the dual coefficients of the vectors of
+    # class i in row j - 1 and of the vectors of class j in row i.
+    gamma = getattr(model, '_gamma', model.gamma)
+    classes = model.classes_
+    dualCoef = model.dual_coef_
+    if len(classes) == 2:
+        return KernelExpansion(model.support_vectors_, dualCoef, model.intercept_,
+                               gamma, classes, 'binary')
+    start = np.concatenate(([0], np.cumsum(model.n_support_)))
+    pairs = [(i, j) for i in range(len(classes)) for j in range(i + 1, len(classes))]
+    coef = np.zeros((len(pairs), dualCoef.shape[1]))
+    for p, (i, j) in enumerate(pairs):
+        coef[p, start[i]:start[i + 1]] = dualCoef[j - 1, start[i]:start[i + 1]]
+        coef[p, start[j]:start[j + 1]] = dualCoef[i, start[j]:start[j + 1]]
+    return KernelExpansion(model.support_vectors_, coef, model.intercept_,
+                           gamma, classes, 'ovo', pairs)
+
+def _fastExp(t):
+    # exp(t) for t <= 0 in float32, the same operations of the C function.
+    t = np.asarray(t, dtype=np.float32)
+    y = t * LOG2_E
+    fi = np.floor(y)
+    f = y - fi
+    p = np.float32(1.0) + f * (FAST_EXP2_C1 + f * (FAST_EXP2_C2 + f * FAST_EXP2_C3))
+    fi = np.maximum(fi, np.float32(-126.0))
+    bits = p.view(np.int32) + fi.astype(np.int32) * np.int32(1 << 23)
+    return np.where(y < np.float32(-126.0), np.float32(0.0), bits.view(np.float32))
+
+class QuantizedModel:
+    # The parameters exactly as written in the C source and the emulator of
+    # the C arithmetic.
+
+    def __init__(self, model, variant='int16', X_calib=None, lutBits=None):
+        if variant not in VARIANTS:
+            raise ValueError("export_c: variant must be one of {0}.".format(VARIANTS))
+        self.expansion = kernelExpansion(model)
+        self.variant = variant
+        exp = self.expansion
+        self.numFeatures = exp.vectors.shape[1]
+        self.elemBytes = {'int8': 1, 'int16': 2, 'float32': 4}[variant]
+        # Rows padded to a multiple of 16 bytes.
+        padElems = 16 // self.elemBytes
+        self.numFeaturesPad = -(-self.numFeatures // padElems) * padElems
+        self.labels = self._intLabels(exp.classes)
+
+        if variant == 'float32':
+            self.vectors = self._pad(exp.vectors.astype(np.float32))
+            self.coef = exp.coef.astype(np.float32)
+            self.intercept = exp.intercept.astype(np.float32)
+            self.negGamma = np.float32(-exp.gamma)
+            return
+
+        qmax = 127 if variant == 'int8' else 32767
+        self.qmax = qmax
+        self.qtype = np.int8 if variant == 'int8' else np.int16
+        data = exp.vectors if X_calib is None else np.vstack((exp.vectors, X_calib))
+        low, high = data.min(axis=0), data.max(axis=0)
+        self.offset = ((low + high) / 2.0).astype(np.float32)
+        scale = max(float(np.max(high - low)) / 2.0, 1e-12) / qmax
+        self.invScale = np.float32(1.0 / scale)
+        self.vectors = self._pad(self.quantizeInput(exp.vectors))
+
+        # Kernel lookup tables, index = distance >> shift with lutBits bits
+        # covering the distances until the kernel value rounds to 0. The
+        # high bits index lutHi and the low bits lutLo, the kernel value is
+        # (lutHi[hi] * lutLo[lo] + 2^14) >> 15.
+        if lutBits is None:
+            lutBits = 12 if variant == 'int8' else 14
+        self.loBits = lutBits // 2
+        self.lutBits = lutBits
+        gs2 = exp.gamma * (1.0 / float(self.invScale)) ** 2
+        maxDist = 17.0 * np.log(2.0) / gs2
+        self.shift = max(0, int(np.ceil(np.log2(maxDist) - lutBits)))
+        step = 2.0 ** self.shift
+        hi = np.arange(2 ** (lutBits - self.loBits)) * step * 2 ** self.loBits
+        lo = np.arange(2 ** self.loBits) * step + (step - 1.0) / 2.0
+        self.lutHi = np.rint(KERNEL_ONE * np.exp(-gs2 * hi)).astype(np.uint16)
+        self.lutLo = np.rint(KERNEL_ONE * np.exp(-gs2 * lo)).astype(np.uint16)
+
+        # Coefficients in int16 with a single scale, intercepts in the scale
+        # of the accumulator (coef * Q15 kernel).
+        self.coefScale = max(float(np.max(np.abs(exp.coef))), 1e-30) / 32767.0
+        self.coef = np.rint(exp.coef / self.coefScale).astype(np.int16)
+        self.intercept = np.rint(exp.intercept * KERNEL_ONE / self.coefScale).astype(np.int64)
+
+    @staticmethod
+    def _intLabels(classes):
+        labels = np.asarray(classes)
+        if not np.all(np.equal(np.mod(labels.astype(np.float64), 1), 0)):
+            raise ValueError("export_c: the class labels must be integers.")
+        return labels.astype(np.int32)
+
+    def _pad(self, V):
+        P = np.zeros((V.shape[0], self.numFeaturesPad), dtype=V.dtype)
+        P[:, :V.shape[1]] = V
+        return P
+
+    def quantizeInput(self, X):
+        # q = clamp(lrintf((x - offset) * invScale)) in float32.
+        X = np.asarray(X, dtype=np.float32)
+        q = np.rint((X - self.offset) * self.invScale)
+        return np.clip(q, -self.qmax, self.qmax).astype(self.qtype)
+
+    def kernelValues(self, X):
+        # (n_samples, n_vectors) kernel values, Q15 ints or float32.
+        if self.variant == 'float32':
+            Xp = self._pad(np.asarray(X, dtype=np.float32))
+            d = np.zeros((Xp.shape[0], self.vectors.shape[0]), dtype=np.float32)
+            for f in range(self.numFeaturesPad):
+                t = Xp[:, f, None] - self.vectors[None, :, f]
+                d = d + t * t
+            return _fastExp(self.negGamma * d)
+
+        Xq = self._pad(self.quantizeInput(X)).astype(np.int64)
+        V = self.vectors.astype(np.int64)
+        d = np.zeros((Xq.shape[0], V.shape[0]), dtype=np.int64)
+        for f in range(self.numFeaturesPad):
+            t = Xq[:, f, None] - V[None, :, f]
+            d += t * t
+        idx = d >> self.shift
+        inside = idx < (1 << self.lutBits)
+        idx = np.minimum(idx, (1 << self.lutBits) - 1)
+        k = (self.lutHi[idx >> self.loBits].astype(np.int64)
+             * self.lutLo[idx & ((1 << self.loBits) - 1)] + (1 << 14)) >> 15
+        return np.where(inside, k, 0)
+
+    def decision(self, X):
+        # Decisions as computed in C, int64 or float32 (accumulated in order).
+        K = self.kernelValues(X)
+        if self.variant == 'float32':
+            dec = np.tile(self.intercept, (K.shape[0], 1))
+            for m in range(K.shape[1]):
+                dec = dec + self.coef[None, :, m] * K[:, m, None]
+            return dec
+        return np.dot(K, self.coef.T.astype(np.int64)) + self.intercept
+
+    def predict(self, X):
+        idx = decisionRule(self.decision(X), self.expansion.rule,
+                           self.expansion.pairs, len(self.labels))
+        return self.expansion.classes[idx]
+
+    def flashBytes(self):
+        numBytes = self.vectors.nbytes + self.coef.nbytes + self.intercept.nbytes + self.labels.nbytes
+        if self.variant != 'float32':
+            numBytes += self.offset.nbytes + 4 + self.lutHi.nbytes + self.lutLo.nbytes
+        if self.expansion.rule == 'ovo':
+            numBytes += 2 * len(self.expansion.pairs)
+        return numBytes
+
+    def ramBytes(self):
+        # Input buffer, kernel values, decisions and votes.
+        numVectors, numDec = self.coef.shape[1], self.coef.shape[0]
+        if self.variant == 'float32':
+            numBytes = 4 * self.numFeaturesPad + 4 * numVectors + 4 * numDec
+        else:
+            numBytes = self.elemBytes * self.numFeaturesPad + 2 * numVectors + 8 * numDec
+        if self.expansion.rule == 'ovo':
+            numBytes += 2 * len(self.labels)
+        return numBytes
+
+    def macsPerInference(self):
+        numVectors, numDec = self.coef.shape[1], self.coef.shape[0]
+        return numVectors * self.numFeaturesPad + numDec * numVectors
+
+    def cSource(self, name):
+        # Returns the text of (header, source).
+        return _cHeader(self, name), _cSource(self, name)
+
+def quantizeModel(model, variant='int16', X_calib=None, lutBits=None):
+    return QuantizedModel(model, variant, X_calib, lutBits)
+
+def writeC(qmodel, name, outDir='.'):
+    # Writes <name>.h and <name>.c in outDir, returns the 2 paths.
+    os.makedirs(outDir, exist_ok=True)
+    header, source = qmodel.cSource(name)
+    headerPath = os.path.join(outDir, name + '.h')
+    sourcePath = os.path.join(outDir, name + '.c')
+    with open(headerPath, 'w') as f:
+        f.write(header)
+    with open(sourcePath, 'w') as f:
+        f.write(source)
+    return headerPath, sourcePath
+
+def exportReport(model, qmodel, X, y):
+    # Accuracy of the float model predict vs the emulated C, and footprint.
+    y_float = model.predict(X)
+    y_quant = qmodel.predict(X)
+    accFloat = accuracy_score(y, y_float)
+    accQuant = accuracy_score(y, y_quant)
+    return {'variant': qmodel.variant,
+            'num_vectors': qmodel.coef.shape[1],
+            'acc_float': accFloat,
+            'acc_quant': accQuant,
+            'acc_loss': accFloat - accQuant,
+            'agreement': float(np.mean(y_float == y_quant)),
+            'flash_bytes': qmodel.flashBytes(),
+            'ram_bytes': qmodel.ramBytes(),
+            'macs_per_inference': qmodel.macsPerInference()}
+
+###############################################################################
+# C code generation.
+
+def _cFloat(v):
+    # 9 significant digits are enough to get back the same float32.
+    text = '{0:.9g}'.format(float(v))
+    if '.' not in text and 'e' not in text:
+        text += '.0'
+    return text + 'f'
+
+def _cArray(values, fmt, perLine=12, indent='    '):
+    items = [fmt(v) for v in np.asarray(values).reshape(-1)]
+    lines = [indent + ', '.join(items[i:i + perLine]) for i in range(0, len(items), perLine)]
+    return ',\n'.join(lines)
+
+def _cArray2D(values, fmt, perLine=16):
+    rows = ['    {\n' + _cArray(row, fmt, perLine, '        ') + '\n    }' for row in values]
+    return ',\n'.join(rows)
+
+def _cHeader(q, name):
+    guard = name.upper() + '_H'
+    return '''/* {name}.h - Generated by export_c.py, {variant} variant. */
+#ifndef {guard}
+#define {guard}
+
+#include <stdint.h>
+
+#define {NAME}_NUM_FEATURES {numFeatures}
+#define {NAME}_NUM_CLASSES  {numClasses}
+#define {NAME}_NUM_VECTORS  {numVectors}
+
+/* Returns the label of the class of the input x[{NAME}_NUM_FEATURES]. */
+int32_t {name}_predict(const float *x);
+
+#endif /* {guard} */
+'''.format(name=name, NAME=name.upper(), guard=guard, variant=q.variant,
+           numFeatures=q.numFeatures, numClasses=len(q.labels),
+           numVectors=q.coef.shape[1])
+
+def _cSource(q, name):
+    exp = q.expansion
+    numVectors, numDec = q.coef.shape[1], q.coef.shape[0]
+    ctype = {'int8': 'int8_t', 'int16': 'int16_t', 'float32': 'float'}[q.variant]
+    lines = ['/* {0}.c - Generated by export_c.py, {1} variant, {2} vectors. */'.format(name, q.variant, numVectors)]
+    if q.variant == 'float32':
+        lines.append('/* Compile with -ffp-contract=off to match the NumPy emulator bit by bit. */')
+    lines += ['#include <math.h>', '#include <stdint.h>', '#include "{0}.h"'.format(name), '',
+              '#define NF     {0}'.format(q.numFeatures),
+              '#define NF_PAD {0}'.format(q.numFeaturesPad),
+              '#define NV     {0}'.format(numVectors),
+              '#define ND     {0}'.format(numDec),
+              '#define NC     {0}'.format(len(q.labels)), '',
+              'static const int32_t labels[NC] = {{\n{0}\n}};'.format(_cArray(q.labels, str))]
+    if exp.rule == 'ovo':
+        lines.append('static const uint8_t pairs[ND][2] = {{\n{0}\n}};'.format(
+            _cArray2D(exp.pairs, str)))
+
+    if q.variant == 'float32':
+        lines += ['static const float neg_gamma = {0};'.format(_cFloat(q.negGamma)),
+                  'static const float vectors[NV][NF_PAD] __attribute__((aligned(16))) = {{\n{0}\n}};'.format(
+                      _cArray2D(q.vectors, _cFloat, 8)),
+                  'static const float coef[ND][NV] = {{\n{0}\n}};'.format(_cArray2D(q.coef, _cFloat, 8)),
+                  'static const float intercept[ND] = {{\n{0}\n}};'.format(_cArray(q.intercept, _cFloat, 8)),
+                  '',
+                  '/* exp(t) for t <= 0, 2^y with the integer part of y in the exponent bits. */',
+                  'static float fast_exp(float t)',
+                  '{',
+                  '    float y = t * {0};'.format(_cFloat(LOG2_E)),
+                  '    if (y < -126.0f) return 0.0f;',
+                  '    float fi = floorf(y);',
+                  '    float f = y - fi;',
+                  '    union { float f; int32_t i; } u;',
+                  '    u.f = 1.0f + f * ({0} + f * ({1} + f * {2}));'.format(
+                      _cFloat(FAST_EXP2_C1), _cFloat(FAST_EXP2_C2), _cFloat(FAST_EXP2_C3)),
+                  '    u.i += (int32_t)fi * (1 << 23);',
+                  '    return u.f;',
+                  '}',
+                  '',
+                  'int32_t {0}_predict(const float *x)'.format(name),
+                  '{',
+                  '    float xp[NF_PAD] __attribute__((aligned(16))) = {0};',
+                  '    float k[NV];',
+                  '    float dec[ND];',
+                  '    for (int f = 0; f < NF; f++) xp[f] = x[f];',
+                  '    for (int m = 0; m < NV; m++) {',
+                  '        float d = 0.0f;',
+                  '        for (int f = 0; f < NF_PAD; f++) {',
+                  '            float t = xp[f] - vectors[m][f];',
+                  '            d += t * t;',
+                  '        }',
+                  '        k[m] = fast_exp(neg_gamma * d);',
+                  '    }',
+                  '    for (int p = 0; p < ND; p++) {',
+                  '        float a = intercept[p];',
+                  '        for (int m = 0; m < NV; m++) a += coef[p][m] * k[m];',
+                  '        dec[p] = a;',
+                  '    }']
+    else:
+        accType = 'int32_t' if q.variant == 'int8' else 'int64_t'
+        lines += ['#define QMAX   {0}'.format(q.qmax),
+                  '#define SHIFT  {0}'.format(q.shift),
+                  '#define LUT_BITS {0}'.format(q.lutBits),
+                  '#define LO_BITS  {0}'.format(q.loBits), '',
+                  'static const float offset[NF] = {{\n{0}\n}};'.format(_cArray(q.offset, _cFloat, 8)),
+                  'static const float inv_scale = {0};'.format(_cFloat(q.invScale)),
+                  'static const {0} vectors[NV][NF_PAD] __attribute__((aligned(16))) = {{\n{1}\n}};'.format(
+                      ctype, _cArray2D(q.vectors, str)),
+                  'static const int16_t coef[ND][NV] = {{\n{0}\n}};'.format(_cArray2D(q.coef, str)),
+                  'static const int64_t intercept[ND] = {{\n{0}\n}};'.format(
+                      _cArray(q.intercept, lambda v: 'INT64_C({0})'.format(int(v)), 4)),
+                  '/* exp(-gamma * distance) in Q15 = lut_hi[idx >> LO_BITS] * lut_lo[idx & low mask],',
+                  '   with idx = distance >> SHIFT. */',
+                  'static const uint16_t lut_hi[1 << (LUT_BITS - LO_BITS)] = {{\n{0}\n}};'.format(_cArray(q.lutHi, str, 16)),
+                  'static const uint16_t lut_lo[1 << LO_BITS] = {{\n{0}\n}};'.format(_cArray(q.lutLo, str, 16)),
+                  '',
+                  'int32_t {0}_predict(const float *x)'.format(name),
+                  '{',
+                  '    {0} xq[NF_PAD] __attribute__((aligned(16))) = {{0}};'.format(ctype),
+                  '    uint16_t k[NV];',
+                  '    int64_t dec[ND];',
+                  '    for (int f = 0; f < NF; f++) {',
+                  '        int32_t v = (int32_t)lrintf((x[f] - offset[f]) * inv_scale);',
+                  '        xq[f] = ({0})(v > QMAX ? QMAX : (v < -QMAX ? -QMAX : v));'.format(ctype),
+                  '    }',
+                  '    for (int m = 0; m < NV; m++) {',
+                  '        {0} d = 0;'.format(accType),
+                  '        for (int f = 0; f < NF_PAD; f++) {',
+                  '            int32_t t = (int32_t)xq[f] - (int32_t)vectors[m][f];',
+                  '            d += ({0})t * t;'.format(accType),
+                  '        }',
+                  '        {0} idx = d >> SHIFT;'.format(accType),
+                  '        k[m] = idx < (1 << LUT_BITS) ? (uint16_t)(((uint32_t)lut_hi[idx >> LO_BITS]',
+                  '               * lut_lo[idx & ((1 << LO_BITS) - 1)] + (1u << 14)) >> 15) : 0;',
+                  '    }',
+                  '    for (int p = 0; p < ND; p++) {',
+                  '        int64_t a = intercept[p];',
+                  '        for (int m = 0; m < NV; m++) a += (int32_t)coef[p][m] * (int32_t)k[m];',
+                  '        dec[p] = a;',
+                  '    }']
+
+    if exp.rule == 'binary':
+        lines += ['    return labels[dec[0] > 0 ? 1 : 0];']
+    elif exp.rule == 'ovr':
+        lines += ['    int best = 0;',
+                  '    for (int p = 1; p < ND; p++) if (dec[p] > dec[best]) best = p;',
+                  '    return labels[best];']
+    else:
+        lines += ['    int16_t votes[NC] = {0};',
+                  '    for (int p = 0; p < ND; p++) votes[dec[p] > 0 ? pairs[p][0] : pairs[p][1]]++;',
+                  '    int best = 0;',
+                  '    for (int c = 1; c < NC; c++) if (votes[c] > votes[best]) best = c;',
+                  '    return labels[best];']
+    lines += ['}', '']
+    return '\n'.join(lines)
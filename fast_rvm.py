@@ -0,0 +1,508 @@
+###############################################################################
+#                                 fast_rvm.py
+#
+# Fast RVM classifier, sequential sparse Bayesian learning (Tipping & Faul 2003).
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: This is a in project implementation of the fast training
+#              algorithm for the RVM, because I couldn't install the
+#              sklearn_bayes package and the scikit-rvm (skrvm) uses the
+#              slower 2001 algorithm. The 2001 algorithm starts with all the N
+#              basis functions and prunes them, so each iteration is O(N^3).
+#
+#              The 2003 algorithm (Sequential Sparse Bayesian Learning) starts
+#              with only one basis function and in each iteration does one of
+#              the following to the basis that increases more the marginal
+#              likelihood:
+#                  - adds a basis function to the model,
+#                  - removes a basis function from the model,
+#                  - re-estimates the alpha (prior precision) of a basis.
+#              For the classification the Laplace approximation of the
+#              Bernoulli likelihood is used, like in the paper. The Laplace
+#              approximation (IRLS of the active weights) and the sparsity and
+#              quality factors of all the basis are computed in an outer loop,
+#              O(N^2 * M_active). With it fixed the problem is a Gaussian one
+#              and an inner loop does the actions with the rank one updates of
+#              the appendix of the paper, O(N * M_active) per action plus
+#              O(N^2) per addition, until no action increases the marginal
+#              likelihood. The outer loop stops when the new Laplace
+#              approximation has no action to do or when its marginal
+#              likelihood stops increasing.
+#              The multiclass classification is done with one-vs-rest, one
+#              binary classifier per class.
+#
+#              It has the scikit-learn fit / predict interface and the same
+#              parameters of skrvm.RVC (kernel, degree, coef1, coef0, n_iter,
+#              tol, alpha, bias_used, verbose), so it's a drop in for it.
+#              In the sequential algorithm the alpha is only the initial prior
+#              precision of the first basis function (the bias, if used) and
+#              it's only used when the fit doesn't start from a previous one,
+#              the final alphas are the ones that maximize the marginal
+#              likelihood. So it doesn't select the model, the hyper-parameter
+#              to sweep is the gamma of the RBF kernel (coef1).
+#
+#              For a sweep of models over the same dataset a KernelCache (see
+#              kernel_cache.py) can be given in kernel_cache, then the squared
+#              distances of the train dataset (RBF kernel, the same for all the
+#              gamma's) or the kernel matrix are computed only once. The
+#              predict only computes the kernel against the relevance vectors.
+#              With warm_start=True a new fit starts from the active basis,
+#              weights and alphas of the previous fit (for example with the
+#              previous gamma), instead of starting from the bias alone.
+#
+#              With kernel='precomputed' fit() takes the train x train kernel
+#              matrix and predict() the test x train kernel matrix, like in
+#              the sklearn SVC (used in the cross validation, where the folds
+#              are slices of one kernel matrix).
+#
+# References:
+#   Tipping M. E. and Faul A. C. (2003), Fast Marginal Likelihood Maximisation
+#   for Sparse Bayesian Models.
+#   http://www.miketipping.com/papers/met-fastsbl.pdf
+###############################################################################
+
+import warnings
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+from scipy.special import expit
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.utils.multiclass import unique_labels
+from svm_sweep import squaredDistanceMatrix
+from kernel_cache import datasetFingerprint
+from profiling import phase
+
+# Number of times that a basis can be deleted before it's excluded.
+MAX_DELETIONS = 2
+
+# Minimum alpha (maximum prior variance of a weight). In separable data the
+# marginal likelihood of the Laplace approximation keeps decreasing the alpha
+# of some basis while its weight goes to infinity.
+ALPHA_MIN = 1e-6
+
+def _logSigmoidLikelihood(a, t):
+    # sum( t * log(y) + (1 - t) * log(1 - y) ) with y = sigmoid(a),
+    # computed in a stable way.
+    return -np.sum(np.logaddexp(0.0, a) - t * a)
+
+class RVC(BaseEstimator, ClassifierMixin):
+    # Fitted attributes:
+    #    classes_           - The classes.
+    #    relevance_         - Indexes in the train dataset of the relevance
+    #                         vectors of all the binary classifiers.
+    #    relevance_vectors_ - The relevance vectors, X_train[relevance_].
+    #    coef_              - (n_classifiers, n_relevance_vectors) weights, zero
+    #                         for the vectors not used by a classifier.
+    #    intercept_         - (n_classifiers,) bias weights.
+    #    n_relevance_       - Number of relevance vectors per classifier
+    #                         (per class in one-vs-rest, one in binary).
+    #    n_iter_            - Number of iterations per classifier.
+
+    # alpha is only the initial precision of the bias (see the header), the
+    # model is selected with the gamma of the RBF kernel, coef1.
+    def __init__(self, kernel='rbf', degree=3, coef1=None, coef0=0.0,
+                 n_iter=1000, tol=1e-3, alpha=1e-6, bias_used=True,
+                 n_iter_solver=30, tol_solver=1e-5, warm_start=False,
+                 kernel_cache=None, verbose=False):
+        self.kernel = kernel
+        self.degree = degree
+        self.coef1  = coef1
+        self.coef0  = coef0
+        self.n_iter = n_iter
+        self.tol    = tol
+        self.alpha  = alpha
+        self.bias_used = bias_used
+        self.n_iter_solver = n_iter_solver
+        self.tol_solver = tol_solver
+        self.warm_start = warm_start
+        self.kernel_cache = kernel_cache
+        self.verbose = verbose
+
+    def _gamma(self, numFeatures):
+        if self.coef1 is None:
+            return 1.0 / numFeatures
+        return self.coef1
+
+    def _kernelMatrix(self, X, Y):
+        if self.kernel == 'rbf':
+            return np.exp(-self._gamma(X.shape[1]) * squaredDistanceMatrix(X, Y))
+        elif self.kernel == 'linear':
+            return np.dot(X, Y.T)
+        elif self.kernel == 'poly':
+            return (self._gamma(X.shape[1]) * np.dot(X, Y.T) + self.coef0) ** self.degree
+        elif self.kernel == 'precomputed':
+            raise ValueError("RVC: with kernel='precomputed' X must be the kernel matrix.")
+        elif callable(self.kernel):
+            return self.kernel(X, Y)
+        else:
+            raise ValueError("RVC: kernel '{0}' not supported.".format(self.kernel))
+
+    def _trainKernel(self, X):
+        # Kernel matrix of the train dataset. With a cache, for the RBF kernel
+        # the squared distances are cached, they are the same for all the
+        # gamma's of a sweep, and for the other kernels the kernel matrix.
+        if self.kernel == 'precomputed':
+            return X
+        if self.kernel_cache is None or callable(self.kernel):
+            return self._kernelMatrix(X, X)
+        if self.kernel == 'rbf':
+            D = self.kernel_cache.get(('distances', datasetFingerprint(X)),
+                                      lambda: squaredDistanceMatrix(X, X))
+            return np.exp(-self._gamma(X.shape[1]) * D)
+        key = ('kernel', self.kernel, self._gamma(X.shape[1]), self.degree, self.coef0,
+               datasetFingerprint(X))
+        return self.kernel_cache.get(key, lambda: self._kernelMatrix(X, X))
+
+    def _designMatrix(self, X):
+        # One basis function per train sample, plus the bias in the last
+        # column.
+        K = self._trainKernel(X)
+        if self.bias_used:
+            return np.hstack((K, np.ones((K.shape[0], 1))))
+        return K
+
+    def _posterior(self, Phi_a, t, A, mu):
+        # Laplace approximation, finds the mode of the posterior of the active
+        # weights with Newton (IRLS) steps and returns it with the covariance.
+        def objective(m):
+            return _logSigmoidLikelihood(np.dot(Phi_a, m), t) - 0.5 * np.sum(A * m * m)
+
+        objCurr = objective(mu)
+        for i in range(self.n_iter_solver):
+            y = expit(np.dot(Phi_a, mu))
+            beta = y * (1.0 - y)
+            grad = np.dot(Phi_a.T, t - y) - A * mu
+            H = np.dot(Phi_a.T * beta, Phi_a)
+            H[np.diag_indices_from(H)] += A
+            step = cho_solve(self._choFactor(H), grad)
+            # Step halving, to not overshoot when the classes are separable.
+            for j in range(10):
+                objNew = objective(mu + step)
+                if objNew >= objCurr:
+                    break
+                step *= 0.5
+            mu = mu + step
+            objCurr = objNew
+            if np.max(np.abs(step)) < self.tol_solver:
+                break
+
+        y = expit(np.dot(Phi_a, mu))
+        beta = y * (1.0 - y)
+        H = np.dot(Phi_a.T * beta, Phi_a)
+        H[np.diag_indices_from(H)] += A
+        Sigma = cho_solve(self._choFactor(H), np.eye(len(mu)))
+        return mu, Sigma, y, beta
+
+    @staticmethod
+    def _logMarginal(Phi_a, t, A, mu, Sigma):
+        # Log marginal likelihood of the Laplace approximation (up to a
+        # constant), log p(t | mu) - mu' A mu / 2 + log|Sigma A| / 2.
+        logDet = np.linalg.slogdet(Sigma)[1] + np.sum(np.log(A))
+        return (_logSigmoidLikelihood(np.dot(Phi_a, mu), t) - 0.5 * np.sum(A * mu * mu)
+                + 0.5 * logDet)
+
+    @staticmethod
+    def _choFactor(H):
+        try:
+            return cho_factor(H)
+        except LinAlgError:
+            jitter = 1e-10 * max(1.0, np.trace(H) / len(H))
+            return cho_factor(H + jitter * np.eye(len(H)))
+
+    def _initialState(self, Phi, t):
+        M = Phi.shape[1]
+        if self.bias_used:
+            start = M - 1
+        else:
+            proj = np.abs(np.dot(Phi.T, t - 0.5)) / np.maximum(np.linalg.norm(Phi, axis=0), 1e-12)
+            start = int(np.argmax(proj))
+        alpha = np.full(M, np.inf)
+        alpha[start] = self.alpha
+        return [start], alpha, np.zeros(1)
+
+    def _fitBinary(self, Phi, t, state=None):
+        # Sequential sparse Bayesian learning of one binary classifier.
+        # Returns the active basis indexes, their weights, covariance and
+        # alphas and the number of iterations. state=(active, alpha, mu)
+        # starts from a previous solution instead of from the bias alone.
+        if state is None:
+            active, alpha, mu = self._initialState(Phi, t)
+        else:
+            # The weights of the previous fit are not a good start for the
+            # IRLS when the kernel changed (another gamma), only the active
+            # basis and their alphas are kept.
+            active, alpha, mu = state
+            active, alpha, mu = list(active), alpha.copy(), np.zeros(len(active))
+        M = Phi.shape[1]
+        PhiSq = Phi * Phi
+        # With the Laplace approximation the predicted change of the marginal
+        # likelihood is not exact, so a basis can be added and deleted in
+        # cycles. A basis deleted MAX_DELETIONS times can't be added again.
+        numDeletions = np.zeros(M, dtype=np.intp)
+
+        numIter = 0
+        bestLogML = -np.inf
+        numNoGain = 0
+        while numIter < self.n_iter:
+            # Laplace approximation at the current active set, B = diag(beta)
+            # and the targets t_hat = Phi_a mu + B^-1 (t - y) stay fixed in
+            # the inner loop, where the problem is a Gaussian one.
+            Phi_a = Phi[:, active]
+            mu, Sigma, y, beta = self._posterior(Phi_a, t, alpha[active], mu)
+
+            # The alphas of the Gaussian problem and the Laplace approximation
+            # can alternate in a cycle, so it also stops when the marginal
+            # likelihood doesn't increase in 2 refreshes in a row.
+            logML = self._logMarginal(Phi_a, t, alpha[active], mu, Sigma)
+            if logML < bestLogML + self.tol:
+                numNoGain += 1
+                if numNoGain == 2:
+                    break
+            else:
+                bestLogML = logML
+                numNoGain = 0
+
+            # Sparsity (S) and quality (Q) factors of all the basis functions,
+            # with G_a = Phi' B Phi_a and e = B t_hat:
+            #    S_m = phi_m' B phi_m - (G_a Sigma G_a')_mm
+            #    Q_m = phi_m' e - (G_a mu)_m
+            G_a = np.dot(Phi.T, Phi_a * beta[:, None])
+            e = beta * np.dot(Phi_a, mu) + (t - y)
+            S = np.dot(beta, PhiSq) - np.sum(np.dot(G_a, Sigma) * G_a, axis=1)
+            Q = np.dot(Phi.T, e) - np.dot(G_a, mu)
+
+            numActions = 0
+            lastM = None
+            while numIter < self.n_iter:
+                m, action, alphaNewM, deltaLM = self._bestAction(S, Q, alpha, len(active), numDeletions)
+                if action is None:
+                    break
+                # After a re-estimation the same alpha is already optimal, if
+                # it's selected again the rounding errors of the updates of S
+                # and Q are too big (alphas near ALPHA_MIN), so they are
+                # computed again.
+                if action == 'reestimate' and m == lastM:
+                    break
+                lastM = m
+                numIter += 1
+                numActions += 1
+
+                # Rank one updates of Sigma, mu, S and Q (Tipping & Faul 2003,
+                # appendix), O(N * M_active), plus O(N^2) for an addition.
+                if action == 'reestimate':
+                    pos = active.index(m)
+                    Sigma_j = Sigma[:, pos].copy()
+                    kappa = 1.0 / (Sigma[pos, pos] + 1.0 / (alphaNewM - alpha[m]))
+                    v = np.dot(G_a, Sigma_j)
+                    S += kappa * v * v
+                    Q += kappa * mu[pos] * v
+                    mu = mu - kappa * mu[pos] * Sigma_j
+                    Sigma = Sigma - kappa * np.outer(Sigma_j, Sigma_j)
+                    alpha[m] = alphaNewM
+                elif action == 'add':
+                    g_i = np.dot(Phi.T, beta * Phi[:, m])
+                    Sigma_ii = 1.0 / (alphaNewM + S[m])
+                    mu_i = Sigma_ii * Q[m]
+                    w = np.dot(Sigma, g_i[active])
+                    e_i = g_i - np.dot(G_a, w)
+                    Sigma = np.block([[Sigma + Sigma_ii * np.outer(w, w), -Sigma_ii * w[:, None]],
+                                      [-Sigma_ii * w[None, :], np.array([[Sigma_ii]])]])
+                    mu = np.append(mu - mu_i * w, mu_i)
+                    S -= Sigma_ii * e_i * e_i
+                    Q -= mu_i * e_i
+                    G_a = np.column_stack((G_a, g_i))
+                    alpha[m] = alphaNewM
+                    active.append(m)
+                else:
+                    pos = active.index(m)
+                    Sigma_j = Sigma[:, pos].copy()
+                    Sigma_jj = Sigma[pos, pos]
+                    v = np.dot(G_a, Sigma_j)
+                    S += v * v / Sigma_jj
+                    Q += mu[pos] / Sigma_jj * v
+                    mu = mu - mu[pos] / Sigma_jj * Sigma_j
+                    Sigma = Sigma - np.outer(Sigma_j, Sigma_j) / Sigma_jj
+                    keep = np.arange(len(active)) != pos
+                    Sigma = Sigma[np.ix_(keep, keep)]
+                    mu = mu[keep]
+                    G_a = G_a[:, keep]
+                    alpha[m] = np.inf
+                    numDeletions[m] += 1
+                    del active[pos]
+
+                if self.verbose:
+                    print("RVC: iter: {0}   {1}   num_active: {2}   delta_L: {3:.6f}".format(
+                        numIter, action, len(active), deltaLM))
+
+            # Converged when the Laplace approximation at the new active set
+            # has no action that increases the marginal likelihood.
+            if numActions == 0:
+                break
+
+        if numIter >= self.n_iter:
+            warnings.warn("RVC: the fit stopped at n_iter={0} iterations without converging, "
+                          "increase n_iter.".format(self.n_iter), ConvergenceWarning)
+
+        Phi_a = Phi[:, active]
+        mu, Sigma, y, beta = self._posterior(Phi_a, t, alpha[active], mu)
+        return active, mu, Sigma, alpha, numIter
+
+    def _bestAction(self, S, Q, alpha, numActive, numDeletions):
+        # Returns (basis, action, new alpha, delta L) of the action that
+        # increases more the log marginal likelihood, action is None when
+        # converged.
+        isActive = np.isfinite(alpha)
+        with np.errstate(all='ignore'):
+            s = S.copy()
+            q = Q.copy()
+            alphaAct = alpha[isActive]
+            s[isActive] = alphaAct * S[isActive] / (alphaAct - S[isActive])
+            q[isActive] = alphaAct * Q[isActive] / (alphaAct - S[isActive])
+            theta = q * q - s
+
+            # Change in the marginal likelihood of each possible action.
+            M = len(alpha)
+            deltaL = np.full(M, -np.inf)
+            alphaNew = np.full(M, np.inf)
+            isPos = theta > 0
+            alphaNew[isPos] = s[isPos] ** 2 / theta[isPos]
+            # A basis is only added when its new alpha is above the floor, if
+            # not it's a weight that goes to infinity (separable data), an
+            # active basis is re-estimated to the floor.
+            inRange = alphaNew >= ALPHA_MIN
+            alphaNew[isPos] = np.maximum(alphaNew[isPos], ALPHA_MIN)
+
+            reest = isActive & isPos
+            d = 1.0 / alphaNew[reest] - 1.0 / alpha[reest]
+            deltaL[reest] = np.where(d == 0, 0.0, Q[reest] ** 2 / (S[reest] + 1.0 / d)
+                                     - np.log1p(S[reest] * d))
+
+            add = ~isActive & isPos & inRange & (numDeletions < MAX_DELETIONS)
+            deltaL[add] = (Q[add] ** 2 / (alphaNew[add] + S[add])
+                           + np.log(alphaNew[add] / (alphaNew[add] + S[add])))
+
+            delete = isActive & ~isPos
+            if numActive > 1:
+                deltaL[delete] = (Q[delete] ** 2 / (S[delete] - alpha[delete])
+                                  - np.log1p(-S[delete] / alpha[delete]))
+        deltaL[~np.isfinite(deltaL)] = -np.inf
+        # For an active basis S_m < alpha_m, when the rounding errors break it
+        # (alpha_m -> 0 in separable data) s_m and q_m are meaningless.
+        deltaL[isActive & ~(alpha > S)] = -np.inf
+
+        # Converged when the best action increases the log marginal
+        # likelihood less than tol (with the Laplace approximation smaller
+        # changes are just noise), or when it is a re-estimation that
+        # doesn't change the alpha (like in Tipping's SparseBayes).
+        m = int(np.argmax(deltaL))
+        if deltaL[m] < self.tol:
+            return m, None, None, deltaL[m]
+        if reest[m]:
+            if abs(np.log(alphaNew[m]) - np.log(alpha[m])) < self.tol:
+                return m, None, None, deltaL[m]
+            return m, 'reestimate', alphaNew[m], deltaL[m]
+        if add[m]:
+            return m, 'add', alphaNew[m], deltaL[m]
+        return m, 'delete', np.inf, deltaL[m]
+
+    def _binaryTargets(self, y):
+        if len(self.classes_) == 2:
+            return [(y == self.classes_[1]).astype(np.float64)]
+        return [(y == c).astype(np.float64) for c in self.classes_]
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        classes = unique_labels(y)
+        if len(classes) < 2:
+            raise ValueError("RVC: needs samples of at least 2 classes.")
+
+        with phase('rvm.design_matrix'):
+            Phi = self._designMatrix(X)
+        states = None
+        if (self.warm_start and hasattr(self, '_states')
+                and np.array_equal(self.classes_, classes)
+                and len(self._states[0][1]) == Phi.shape[1]):
+            states = self._states
+        self.classes_ = classes
+        with phase('rvm.iterations'):
+            self._fitDesign(X, Phi, y, states)
+        return self
+
+    def _fitDesign(self, X, Phi, y, states=None):
+        N = X.shape[0]
+        fits = []
+        for k, t in enumerate(self._binaryTargets(y)):
+            state = None if states is None else states[k]
+            fits.append(self._fitBinary(Phi, t, state))
+
+        # Union of the relevance vectors of all the binary classifiers, the
+        # kernel in predict is computed only once for all of them.
+        relevance = sorted(set(m for active, _, _, _, _ in fits for m in active if m < N))
+        position = dict((m, i) for i, m in enumerate(relevance))
+        self.relevance_ = np.array(relevance, dtype=np.intp)
+        self.relevance_vectors_ = X[self.relevance_]
+        self.coef_ = np.zeros((len(fits), len(relevance)))
+        self.intercept_ = np.zeros(len(fits))
+        self.n_relevance_ = np.zeros(len(fits), dtype=np.intp)
+        self.n_iter_ = np.zeros(len(fits), dtype=np.intp)
+        self.active_ = []
+        self.alpha_ = []
+        self.sigma_ = []
+        self.mu_ = []
+        self._states = []
+        for k, (active, mu, Sigma, alpha, numIter) in enumerate(fits):
+            for m, w in zip(active, mu):
+                if m < N:
+                    self.coef_[k, position[m]] = w
+                else:
+                    self.intercept_[k] = w
+            self.n_relevance_[k] = sum(1 for m in active if m < N)
+            self.n_iter_[k] = numIter
+            self.active_.append(np.array(active, dtype=np.intp))
+            self.alpha_.append(alpha[active])
+            self.sigma_.append(Sigma)
+            self.mu_.append(mu)
+            self._states.append((active, alpha, mu))
+        self._numTrain = N
+        return self
+
+    def _relevanceKernel(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if len(self.relevance_) == 0:
+            return np.zeros((X.shape[0], 0))
+        if self.kernel == 'precomputed':
+            return X[:, self.relevance_]
+        # The predict doesn't use the kernel cache, the kernel against the
+        # relevance vectors is cheaper than the hash of X.
+        return self._kernelMatrix(X, self.relevance_vectors_)
+
+    def decision_function(self, X):
+        K = self._relevanceKernel(X)
+        dec = np.dot(K, self.coef_.T) + self.intercept_
+        if len(self.classes_) == 2:
+            return dec[:, 0]
+        return dec
+
+    def predict_proba(self, X):
+        # Probit approximation of the predictive distribution, the latent
+        # mean is moderated by it's variance phi' Sigma phi.
+        K = self._relevanceKernel(X)
+        position = dict((m, i) for i, m in enumerate(self.relevance_))
+        prob = np.zeros((K.shape[0], len(self.active_)))
+        for k, active in enumerate(self.active_):
+            cols = [K[:, position[m]] if m < self._numTrain else np.ones(K.shape[0])
+                    for m in active]
+            Phi_a = np.column_stack(cols)
+            mean = np.dot(Phi_a, self.mu_[k])
+            var  = np.sum(np.dot(Phi_a, self.sigma_[k]) * Phi_a, axis=1)
+            prob[:, k] = expit(mean / np.sqrt(1.0 + np.pi * var / 8.0))
+        if len(self.classes_) == 2:
+            return np.column_stack((1.0 - prob[:, 0], prob[:, 0]))
+        return prob / np.maximum(prob.sum(axis=1, keepdims=True), 1e-300)
+
+    def predict(self, X):
+        dec = self.decision_function(X)
+        if len(self.classes_) == 2:
+            return self.classes_[(dec > 0).astype(np.intp)]
+        return self.classes_[np.argmax(dec, axis=1)]
@@ -0,0 +1,69 @@
+###############################################################################
+#                               kernel_cache.py
+#
+# In memory LRU cache of kernel matrices with a budget of bytes.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: In a sweep of the RVM gamma the squared distances of the train
+#              dataset, from which the RBF design matrix is computed, are the
+#              same for every gamma. This cache keeps them in memory (or the
+#              kernel matrix of the other kernels), with a key made of the
+#              kind of matrix, the kernel parameters and a fingerprint (hash)
+#              of the content of the dataset. When the total bytes go above
+#              the budget the least recently used matrices are removed.
+#
+#              The counters hits and misses are used to confirm that the sweep
+#              is really reusing the matrices.
+###############################################################################
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+def datasetFingerprint(X):
+    # Hash of the shape, type and content of the array.
+    X = np.ascontiguousarray(X)
+    h = hashlib.sha1()
+    h.update(str((X.shape, X.dtype.str)).encode('ascii'))
+    h.update(X.view(np.uint8).reshape(-1))
+    return h.hexdigest()
+
+class KernelCache:
+
+    def __init__(self, maxBytes=256 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.numBytes = 0
+        self.hits   = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        # Returns the matrix of the key, computing it with compute() if it's
+        # not in the cache.
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        value = compute()
+        if value.nbytes <= self.maxBytes:
+            # The cached matrices are shared, so they are made read only.
+            value.setflags(write=False)
+            self._entries[key] = value
+            self.numBytes += value.nbytes
+            while self.numBytes > self.maxBytes:
+                oldKey, oldValue = self._entries.popitem(last=False)
+                self.numBytes -= oldValue.nbytes
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.numBytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'bytes': self.numBytes,
+                'max_bytes': self.maxBytes}
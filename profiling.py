@@ -0,0 +1,71 @@
+###############################################################################
+#                                 profiling.py
+#
+# Hooks to time the phases of the sweeps (distances, fits, predicts, ...).
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The sweeps mark their phases with
+#
+#                  with phase('svm.distances'):
+#                      ...
+#
+#              that costs nothing when no hook is registered. A hook is any
+#              callable hook(name, seconds), called at the end of each phase.
+#              PhaseTimer is a hook that adds the time and the number of calls
+#              of each phase, used by benchmark.py:
+#
+#                  with PhaseTimer() as timer:
+#                      genBestSVM(X_train, y_train, X_test, y_test)
+#                  print(timer.report())
+#
+#              Only the phases of the main process are seen, the work inside
+#              the worker processes is timed as a whole by the phase that
+#              waits for it.
+###############################################################################
+
+import time
+from contextlib import contextmanager
+
+_phaseHooks = []
+
+def addPhaseHook(hook):
+    _phaseHooks.append(hook)
+
+def removePhaseHook(hook):
+    if hook in _phaseHooks:
+        _phaseHooks.remove(hook)
+
+@contextmanager
+def phase(name):
+    if len(_phaseHooks) == 0:
+        yield
+        return
+    startTime = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - startTime
+        for hook in list(_phaseHooks):
+            hook(name, elapsed)
+
+class PhaseTimer:
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def __call__(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def __enter__(self):
+        addPhaseHook(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        removePhaseHook(self)
+
+    def report(self):
+        # {phase name: {'seconds': total, 'calls': number of calls}}
+        return {name: {'seconds': self.seconds[name], 'calls': self.calls[name]}
+                for name in sorted(self.seconds)}
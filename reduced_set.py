@@ -0,0 +1,196 @@
+###############################################################################
+#                                reduced_set.py
+#
+# Reduced set compression of the SVM, less support vectors for a faster
+# inference in the micro-controller.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The inference cost (time and memory) of the SVM is linear in
+#              the number of support vectors. After the training, the
+#              decision function of the SVM
+#
+#                 dec_p(x) = sum_m coef[p][m] * exp(-gamma * ||x - v_m||^2) + b_p
+#
+#              can be approximated with a much smaller set of vectors, with new
+#              coefficients and intercepts fitted by (ridge) least squares to
+#              the decisions of the original SVM in a reference dataset (the
+#              train dataset). There are 2 methods:
+#
+#                greedy - Greedy elimination of support vectors, in each step
+#                         the vectors with the smallest contribution to the
+#                         decisions are removed and the coefficients of the
+#                         others are fitted again.
+#                kmeans - Synthetic vectors, the centers of a k-means of the
+#                         support vectors of each class (in proportion to
+#                         the number of vectors of the class).
+#
+#              The size is given by a target number of vectors and / or by a
+#              maximum accuracy drop in a validation dataset, the result is
+#              the smallest model that respects it.
+#
+#              The result is a ReducedSetSVM, that has predict() so it can be
+#              used with printDataSetTestVsPred(), and that can be exported to
+#              C with export_c.py.
+###############################################################################
+
+import time
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.metrics import accuracy_score
+from svm_sweep import squaredDistanceMatrix
+from export_c import KernelExpansion, kernelExpansion, quantizeModel
+
+class ReducedSetSVM:
+
+    def __init__(self, expansion, method):
+        self.expansion = expansion
+        self.method = method
+
+    @property
+    def classes_(self):
+        return self.expansion.classes
+
+    @property
+    def support_vectors_(self):
+        return self.expansion.vectors
+
+    @property
+    def numVectors(self):
+        return self.expansion.numVectors
+
+    def decision_function(self, X):
+        return self.expansion.decision_function(X)
+
+    def predict(self, X):
+        return self.expansion.predict(X)
+
+def _fitCoefficients(K, F, ridge):
+    # Least squares of [K 1] [C' ; b'] = F with a small ridge relative to the
+    # scale of K, returns (coef (P, S), intercept (P,)).
+    A = np.hstack((K, np.ones((K.shape[0], 1))))
+    AtA = np.dot(A.T, A)
+    lam = ridge * max(np.trace(AtA) / AtA.shape[0], 1e-12)
+    AtA[np.diag_indices_from(AtA)] += lam
+    W = np.linalg.solve(AtA, np.dot(A.T, F))
+    return W[:-1].T, W[-1]
+
+def _reduced(original, vectors, K, F, ridge):
+    coef, intercept = _fitCoefficients(K, F, ridge)
+    return KernelExpansion(vectors, coef, intercept, original.gamma,
+                           original.classes, original.rule, original.pairs)
+
+def _greedySizes(numVectors, minVectors, fraction=0.1):
+    # Sizes of the greedy steps, removing ~10% of the vectors per step.
+    sizes = []
+    size = numVectors
+    while size > minVectors:
+        size = max(minVectors, size - max(1, int(fraction * size)))
+        sizes.append(size)
+    return sizes
+
+def _greedyCandidates(original, X_ref, F, minVectors, ridge):
+    # Yields the reduced expansions, from the biggest to the smallest.
+    K_all = np.exp(-original.gamma * squaredDistanceMatrix(X_ref, original.vectors))
+    keep = np.arange(original.numVectors)
+    coef = original.coef
+    for size in _greedySizes(original.numVectors, minVectors):
+        # Contribution of each vector to the decisions in the reference set.
+        contribution = np.linalg.norm(coef, axis=0) * np.linalg.norm(K_all[:, keep], axis=0)
+        keep = np.sort(keep[np.argsort(contribution)[len(keep) - size:]])
+        expansion = _reduced(original, original.vectors[keep], K_all[:, keep], F, ridge)
+        coef = expansion.coef
+        yield expansion
+
+def _centersPerClass(counts, numVectors):
+    # Split of numVectors by the largest remainder method, proportional to
+    # the counts, with at least one and at most counts[i] per class. The sum
+    # is exactly numVectors (clipped to [number of classes, counts.sum()]).
+    numVectors = min(max(numVectors, len(counts)), int(counts.sum()))
+    quotas = numVectors * counts / float(counts.sum())
+    perClass = np.minimum(counts, np.maximum(1, np.floor(quotas).astype(int)))
+    while perClass.sum() < numVectors:
+        remainder = np.where(perClass < counts, quotas - perClass, -np.inf)
+        perClass[np.argmax(remainder)] += 1
+    while perClass.sum() > numVectors:
+        remainder = np.where(perClass > 1, quotas - perClass, np.inf)
+        perClass[np.argmin(remainder)] -= 1
+    return perClass
+
+def _kmeansCandidate(original, y_vectors, X_ref, F, numVectors, ridge, seed):
+    # numVectors centers split by the classes of the support vectors.
+    labels, counts = np.unique(y_vectors, return_counts=True)
+    perClass = _centersPerClass(counts, numVectors)
+    centers = []
+    for label, numCenters in zip(labels, perClass):
+        V = original.vectors[y_vectors == label]
+        km = KMeans(n_clusters=numCenters, n_init=4, random_state=seed).fit(V)
+        centers.append(km.cluster_centers_)
+    centers = np.vstack(centers)
+    K = np.exp(-original.gamma * squaredDistanceMatrix(X_ref, centers))
+    return _reduced(original, centers, K, F, ridge)
+
+def _vectorClasses(model, expansion):
+    # Class of each support vector (they are sorted by class in libsvm).
+    if hasattr(model, 'n_support_'):
+        return np.repeat(expansion.classes, model.n_support_)
+    return np.zeros(expansion.numVectors)
+
+def reduceSVM(model, X_ref, method='greedy', targetVectors=None, maxAccDrop=None,
+              X_val=None, y_val=None, ridge=1e-6, seed=0):
+    # model is a fitted RBF SVC (or PrecomputedRBFSVC), X_ref the dataset
+    # where the decisions are approximated (the train dataset). With
+    # maxAccDrop the accuracy in (X_val, y_val) can't drop more than that,
+    # targetVectors is then the minimum number of vectors.
+    original = kernelExpansion(model)
+    X_ref = np.asarray(X_ref, dtype=np.float64)
+    F = original.decision_function(X_ref)
+    if targetVectors is None and maxAccDrop is None:
+        raise ValueError("reduced_set: give targetVectors and / or maxAccDrop.")
+    if maxAccDrop is not None and (X_val is None or y_val is None):
+        raise ValueError("reduced_set: maxAccDrop needs X_val and y_val.")
+    minVectors = 1 if targetVectors is None else max(1, min(int(targetVectors), original.numVectors))
+
+    if method == 'greedy':
+        candidates = _greedyCandidates(original, X_ref, F, minVectors, ridge)
+    elif method == 'kmeans':
+        y_vectors = _vectorClasses(model, original)
+        # Without the accuracy constraint only the target size is needed.
+        sizes = [minVectors] if maxAccDrop is None else _greedySizes(original.numVectors, minVectors)
+        candidates = (_kmeansCandidate(original, y_vectors, X_ref, F, size, ridge, seed)
+                      for size in sizes)
+    else:
+        raise ValueError("reduced_set: unknown method '{0}'.".format(method))
+
+    best = original
+    if maxAccDrop is None:
+        for best in candidates:
+            pass
+    else:
+        accMin = accuracy_score(y_val, original.predict(X_val)) - maxAccDrop
+        for expansion in candidates:
+            if accuracy_score(y_val, expansion.predict(X_val)) >= accMin:
+                best = expansion
+    return ReducedSetSVM(best, method)
+
+def _predictTime(model, X, repeat=5):
+    bestTime = np.inf
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        model.predict(X)
+        bestTime = min(bestTime, time.perf_counter() - startTime)
+    return bestTime
+
+def compressionReport(model, reduced, X, y):
+    # Accuracy, size (float32 C flash bytes) and speed up of the reduced SVM.
+    original = kernelExpansion(model)
+    qOriginal = quantizeModel(original, 'float32')
+    qReduced  = quantizeModel(reduced, 'float32')
+    return {'num_vectors': original.numVectors,
+            'num_vectors_reduced': reduced.numVectors,
+            'acc': accuracy_score(y, model.predict(X)),
+            'acc_reduced': accuracy_score(y, reduced.predict(X)),
+            'flash_bytes': qOriginal.flashBytes(),
+            'flash_bytes_reduced': qReduced.flashBytes(),
+            'size_reduction': 1.0 - qReduced.flashBytes() / float(qOriginal.flashBytes()),
+            'macs_speed_up': qOriginal.macsPerInference() / float(qReduced.macsPerInference()),
+            'measured_speed_up': _predictTime(original, X) / _predictTime(reduced, X)}
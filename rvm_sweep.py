@@ -0,0 +1,104 @@
+###############################################################################
+#                                 rvm_sweep.py
+#
+# Warm started sweep of the RVM gamma, with a shared kernel matrix cache.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: In the sweep of the RVM, each model was fitted from a cold
+#              start, computing again the RBF design matrix and starting again
+#              the hyper-parameters, but the neighbour gamma's converge to
+#              nearly the same active basis and alphas. The swept
+#              hyper-parameter is the gamma of the RBF kernel (coef1), the
+#              alpha of the RVC is only the initial precision of the bias
+#              (see fast_rvm.py).
+#
+#              Here all the fits share a KernelCache, so the squared distances
+#              of the train dataset are computed only once for all the gamma's.
+#              Each fit starts from a copy of the previous converged model
+#              (warm start), its active basis and alphas, with the gamma's
+#              fitted from the biggest to the smallest.
+#
+#              The cache hits / misses and the number of iterations of each
+#              fit (per binary classifier) are recorded so that the speed up
+#              of the sweep can be confirmed.
+###############################################################################
+
+import copy
+import numpy as np
+from sklearn.metrics import accuracy_score
+from fast_rvm import RVC
+from kernel_cache import KernelCache
+from profiling import phase
+
+class RVMGammaSweep:
+    # Each result of run() is a tuple (gamma, accTrain, accTest,
+    # numSupportVectors, model) in the same order of gammaVals, like in
+    # svm_sweep.SVMGammaSweep. trainIdx optionally selects a subset of the
+    # train dataset (used by the successive halving search strategy).
+    #
+    #    sweep = RVMGammaSweep(X_train, y_train, X_test, y_test)
+    #    results = sweep.run(gammaVals)
+    #    print(sweep.cacheStats(), sweep.iterations)
+
+    def __init__(self, X_train, y_train, X_test, y_test, kernelCache=None,
+                 warmStart=True, **rvcParams):
+        self.X_train = np.asarray(X_train, dtype=np.float64)
+        self.y_train = np.asarray(y_train)
+        self.X_test  = np.asarray(X_test, dtype=np.float64)
+        self.y_test  = np.asarray(y_test)
+        self.kernelCache = KernelCache() if kernelCache is None else kernelCache
+        self.warmStart = warmStart
+        self.rvcParams = rvcParams
+        self.rvcParams.setdefault('kernel', 'rbf')
+        # One entry (gamma, n_iter_ per binary classifier) per fit.
+        self.iterations = []
+        self._lastModel = None
+
+    def cacheStats(self):
+        return self.kernelCache.stats()
+
+    def _newModel(self, gammaVal):
+        if self.warmStart and self._lastModel is not None:
+            # Shallow copy, so that the copy shares the cache and starts from
+            # the state of the last model, fit() replaces all the fitted
+            # attributes so the last model is not changed.
+            clf = copy.copy(self._lastModel)
+            clf.set_params(coef1=gammaVal)
+            return clf
+        return RVC(coef1=gammaVal, warm_start=self.warmStart,
+                   kernel_cache=self.kernelCache, **self.rvcParams)
+
+    def run(self, gammaVals, trainIdx=None):
+        X_fit, y_fit = self.X_train, self.y_train
+        if trainIdx is not None:
+            X_fit, y_fit = self.X_train[trainIdx], self.y_train[trainIdx]
+            # The state of the full dataset is not a warm start for a subset.
+            self._lastModel = None
+
+        # The fits are done from the biggest to the smallest gamma, starting
+        # from a small gamma (near linear kernel, the weights of separable
+        # classes go to infinity) is a bad start for a bigger one.
+        order = sorted(range(len(gammaVals)), key=lambda i: -gammaVals[i])
+        results = [None] * len(gammaVals)
+        for i in order:
+            gammaVal = gammaVals[i]
+            with phase('rvm.fit'):
+                clf = self._newModel(gammaVal).fit(X_fit, y_fit)
+            self.iterations.append((gammaVal, clf.n_iter_.copy()))
+
+            # Relevance Vectors
+            numSupportVectors = clf.n_relevance_ # Per class
+
+            with phase('rvm.predict'):
+                y_pred = clf.predict(X_fit)
+                accTrain = accuracy_score(y_fit, y_pred)
+
+                y_pred = clf.predict(self.X_test)
+                accTest = accuracy_score(self.y_test, y_pred)
+
+            results[i] = (gammaVal, accTrain, accTest, numSupportVectors, clf)
+            self._lastModel = clf
+
+        if trainIdx is not None:
+            self._lastModel = None
+        return results
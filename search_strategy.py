@@ -0,0 +1,186 @@
+###############################################################################
+#                              search_strategy.py
+#
+# Adaptive search strategies for the hyper-parameter (gamma) of the SVM and
+# RVM generators.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The linear grids of genBestSVM (999 gamma's) and genBestRVM
+#              (12 gamma's) spend most of the fits in regions where the
+#              selection criterion doesn't change. The criterion is:
+#                  small difference between the train and test accuracy
+#                  (delta < 0.1) while maximizing the train accuracy.
+#
+#              Here there are 3 strategies that can be plugged into both
+#              generators:
+#
+#                LogScan          - Log spaced coarse scan of the range.
+#                RefineAroundBest - Log scan followed by successive
+#                                   refinements around the best value.
+#                SuccessiveHalving - Many random (log uniform) candidates
+#                                   fitted on a small part of the train
+#                                   dataset, only the best half goes to the
+#                                   next rung with the double of the data,
+#                                   the last rung uses the full dataset.
+#
+#              All strategies have a budget (maximum number of fits) and a
+#              seed so that the search is reproducible.
+#
+#              A strategy calls evaluate(paramVals, trainIdx) that returns a
+#              list of tuples (paramVal, accTrain, accTest, numSupportVectors,
+#              model) in the same order of paramVals. trainIdx is None for
+#              the full train dataset or the indexes of the subset to use.
+###############################################################################
+
+import numpy as np
+
+MAX_ACC_DELTA = 0.1
+
+def isNewTop(topResult, accTrain, accTest, maxDelta=MAX_ACC_DELTA):
+    # We want a small difference between the train accuracy and the
+    # test accuracy, so that neither one is overfitting,
+    # while maximizing the absolute train value.
+    deltaCurr = abs(accTrain - accTest)
+    return (topResult is None) or (deltaCurr < maxDelta and topResult[1] < accTrain)
+
+def selectTop(results, maxDelta=MAX_ACC_DELTA):
+    # The same rule of the generators loop, the first result is taken and
+    # then it's replaced only by a strictly better one.
+    topResult = None
+    for result in results:
+        if isNewTop(topResult, result[1], result[2], maxDelta):
+            topResult = result
+    return topResult
+
+def selectionKey(accTrain, accTest, maxDelta=MAX_ACC_DELTA):
+    # Sort key to rank the candidates, the bigger the better. It's the train
+    # accuracy penalized by how much the delta goes above maxDelta, so that
+    # a candidate that almost respects the delta with a high train accuracy
+    # is still a good place to search near by.
+    deltaCurr = abs(accTrain - accTest)
+    return (accTrain - max(0.0, deltaCurr - maxDelta), accTrain)
+
+def _stratifiedSubset(y, fraction, rng):
+    # Random subset of the train indexes with the same proportion of each
+    # class (at least 2 of each class, so the classifier sees all of them).
+    y = np.asarray(y)
+    subset = []
+    for label in np.unique(y):
+        idx = np.flatnonzero(y == label)
+        numTake = min(len(idx), max(2, int(round(fraction * len(idx)))))
+        subset.append(rng.choice(idx, numTake, replace=False))
+    return np.sort(np.concatenate(subset))
+
+class SearchStrategy:
+    # Base class, budget is the maximum number of fits.
+
+    def __init__(self, budget=40, seed=0):
+        self.budget = int(budget)
+        self.seed   = seed
+        self.numFits = 0
+
+    def search(self, evaluate, low, high, y_train=None):
+        raise NotImplementedError
+
+    def _evaluate(self, evaluate, paramVals, trainIdx=None):
+        paramVals = list(paramVals)[:max(0, self.budget - self.numFits)]
+        if len(paramVals) == 0:
+            return []
+        self.numFits += len(paramVals)
+        return evaluate(paramVals, trainIdx)
+
+class LogScan(SearchStrategy):
+    # Log spaced scan of [low, high] with budget points.
+
+    def search(self, evaluate, low, high, y_train=None):
+        self.numFits = 0
+        paramVals = np.geomspace(low, high, self.budget)
+        return self._evaluate(evaluate, paramVals)
+
+class RefineAroundBest(SearchStrategy):
+    # A coarse log scan of numPoints, then each round scans numPoints around
+    # each of the numBest best values found until now (ranked with the
+    # selectionKey), in a log interval that shrinks with the step of the
+    # previous round. Stops when the budget is spent or the step is smaller
+    # than minRatio.
+
+    def __init__(self, budget=40, seed=0, numPoints=8, numBest=2, minRatio=1.001):
+        SearchStrategy.__init__(self, budget, seed)
+        self.numPoints = int(numPoints)
+        self.numBest   = int(numBest)
+        self.minRatio  = minRatio
+
+    def search(self, evaluate, low, high, y_train=None):
+        self.numFits = 0
+        paramVals = np.geomspace(low, high, self.numPoints)
+        step = (high / low) ** (1.0 / (self.numPoints - 1))
+        results = self._evaluate(evaluate, paramVals)
+        seen = set(float(p) for p in paramVals)
+        while self.numFits < self.budget and step > self.minRatio:
+            ranked = sorted(results, key=lambda r: selectionKey(r[1], r[2]), reverse=True)
+            paramVals = []
+            for result in ranked[:self.numBest]:
+                # The new points go in between the neighbours of the best one.
+                lowCurr  = max(low,  result[0] / step)
+                highCurr = min(high, result[0] * step)
+                paramVals.extend(float(p) for p in np.geomspace(lowCurr, highCurr, self.numPoints + 2)[1:-1]
+                                 if float(p) not in seen)
+                seen.update(paramVals)
+            results.extend(self._evaluate(evaluate, paramVals))
+            step = step ** (2.0 / (self.numPoints + 1))
+        return results
+
+class SuccessiveHalving(SearchStrategy):
+    # numCandidates log uniform random values (by default half of the
+    # budget, because the rungs sum to about the double of the first one).
+    # Rung 0 fits all of them in minFraction of the train dataset, each next
+    # rung keeps the best 1/eta with eta times more data, the last rung is
+    # always the full train dataset. It stops early when only one candidate
+    # is left. The rungs are planned before the search, when their sum is
+    # above the budget the number of candidates is reduced, so that the
+    # last rung (full train dataset) is always evaluated.
+
+    def __init__(self, budget=40, seed=0, numCandidates=None, eta=2, minFraction=0.25):
+        SearchStrategy.__init__(self, budget, seed)
+        self.numCandidates = numCandidates
+        self.eta = eta
+        self.minFraction = minFraction
+
+    def rungSizes(self, numCandidates, halving=True):
+        # Number of fits of each rung, the last one is the full dataset.
+        sizes = []
+        fraction = self.minFraction
+        while halving and fraction < 1.0 and numCandidates > 1:
+            sizes.append(numCandidates)
+            numCandidates = max(1, int(np.ceil(numCandidates / self.eta)))
+            fraction = min(1.0, fraction * self.eta)
+        sizes.append(numCandidates)
+        return sizes
+
+    def search(self, evaluate, low, high, y_train=None):
+        if self.budget < 1:
+            raise ValueError("SuccessiveHalving: the budget must be at least 1 fit.")
+        self.numFits = 0
+        rng = np.random.RandomState(self.seed)
+        numCandidates = self.numCandidates
+        if numCandidates is None:
+            numCandidates = max(2, self.budget // 2)
+        numCandidates = max(1, int(numCandidates))
+        while numCandidates > 1 and sum(self.rungSizes(numCandidates, y_train is not None)) > self.budget:
+            numCandidates -= 1
+        candidates = np.sort(np.exp(rng.uniform(np.log(low), np.log(high), numCandidates)))
+        candidates = [float(c) for c in candidates]
+
+        fraction = self.minFraction
+        while True:
+            if fraction >= 1.0 or len(candidates) <= 1 or y_train is None:
+                # Last rung, full train dataset.
+                return self._evaluate(evaluate, candidates)
+            trainIdx = _stratifiedSubset(y_train, fraction, rng)
+            results = self._evaluate(evaluate, candidates, trainIdx)
+            if len(results) == 0:
+                return results
+            ranked = sorted(results, key=lambda r: selectionKey(r[1], r[2]), reverse=True)
+            numKeep = max(1, int(np.ceil(len(candidates) / self.eta)))
+            candidates = sorted(r[0] for r in ranked[:numKeep])
+            fraction = min(1.0, fraction * self.eta)
@@ -0,0 +1,302 @@
+###############################################################################
+#                                 streaming.py
+#
+# Streaming inference of the word detection, from a WAV file or a raw PCM
+# pipe, with the latency and throughput of the model.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: In the micro-controller the model doesn't classify a static
+#              test dataset, it classifies the FFT frames of the microphone
+#              audio while they arrive. This is a local stand-in of that
+#              pipeline, to know if a SVM / RVM keeps up with the real time
+#              audio before putting it in the firmware:
+#
+#                audio blocks --> sliding window FFT features --> ring buffer
+#                             --> micro-batches --> model.predict()
+#
+#              The audio comes from a WAV file (16 bits PCM, the first
+#              channel), from a raw PCM file or pipe ('-' is the standard
+#              input, for example "arecord -t raw -f S16_LE -r 8000 | ..."),
+#              or from an array of samples.
+#
+#              The features of each window of frameSize samples (hopSize
+#              samples apart) are the 32 bins of the FFT in dB, like in the
+#              dataset (20 * log10 of the magnitude, all the 32 bins of a 32
+#              points FFT, so they are mirrored). All the windows of a block
+#              are computed at once.
+#
+#              The capture and the classification are decoupled with a
+#              virtual clock, like in the micro-controller where the audio
+#              keeps arriving (DMA) while the CPU computes. Each block arrives
+#              at the audio time of its last sample, the CPU clock advances by
+#              the measured time of the features and of each predict(). Before
+#              the next block arrives, the CPU only classifies the micro-
+#              batches (batchSize frames) that it can start before it, the
+#              others wait in a preallocated ring buffer. When the model
+#              doesn't keep up the buffer fills and the oldest frames are
+#              dropped (and counted). With frameSkip only one in each
+#              frameSkip + 1 frames is classified.
+#
+#              The latency of each classified frame is the time from the
+#              arrival of its block to the end of the predict() of its batch,
+#              in the virtual clock. With realTime=True the reading is paced at
+#              the sample rate (like a microphone), otherwise the audio is
+#              processed as fast as possible, the result is the same. The real
+#              time factor is the seconds of audio per second of processing,
+#              it keeps up when it's at least 1 and no frame was dropped.
+###############################################################################
+
+import sys
+import time
+import wave
+import numpy as np
+
+def readWav(fileName):
+    # Returns (samples in [-1, 1) float32, sampleRate), the first channel.
+    with wave.open(fileName, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError("streaming: only 16 bits PCM WAV files are supported.")
+        numChannels = f.getnchannels()
+        sampleRate = f.getframerate()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+    return data[::numChannels].astype(np.float32) / 32768.0, sampleRate
+
+def writeWav(fileName, samples, sampleRate):
+    # samples in [-1, 1), written as 16 bits PCM mono.
+    data = np.clip(np.round(np.asarray(samples) * 32768.0), -32768, 32767).astype('<i2')
+    with wave.open(fileName, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sampleRate)
+        f.writeframes(data.tobytes())
+
+def synthAudio(seconds=10.0, sampleRate=8000, seed=0):
+    # Stand-in audio when there is no recording, noise with bursts of tones
+    # (the "words") of random frequencies.
+    rng = np.random.RandomState(seed)
+    n = int(seconds * sampleRate)
+    t = np.arange(n) / float(sampleRate)
+    samples = 0.01 * rng.randn(n)
+    burstSize = int(0.3 * sampleRate)
+    for start in range(0, n - burstSize, int(sampleRate)):
+        freq = rng.uniform(200.0, 0.45 * sampleRate)
+        envelope = np.hanning(burstSize)
+        samples[start:start + burstSize] += 0.5 * envelope * np.sin(2 * np.pi * freq * t[start:start + burstSize])
+    return samples.astype(np.float32)
+
+def iterAudioBlocks(source, blockSize=1024, sampleRate=8000, realTime=False):
+    # Yields (samples block float32, sampleRate). source is a WAV file name,
+    # a raw PCM (16 bits little endian mono) file name, '-' for the standard
+    # input, a binary file object or an array of samples. With realTime each
+    # block is only given when it would have been recorded.
+    if isinstance(source, np.ndarray):
+        samples = source.astype(np.float32)
+        blocks = (samples[i:i + blockSize] for i in range(0, len(samples), blockSize))
+    elif isinstance(source, str) and source.lower().endswith('.wav'):
+        samples, sampleRate = readWav(source)
+        blocks = (samples[i:i + blockSize] for i in range(0, len(samples), blockSize))
+    else:
+        blocks = _iterRawBlocks(source, blockSize)
+
+    startTime = time.perf_counter()
+    numSamples = 0
+    for block in blocks:
+        numSamples += len(block)
+        if realTime:
+            delay = startTime + numSamples / float(sampleRate) - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield block, sampleRate
+
+def _iterRawBlocks(source, blockSize):
+    if source == '-':
+        f, close = sys.stdin.buffer, False
+    elif isinstance(source, str):
+        f, close = open(source, 'rb'), True
+    else:
+        f, close = source, False
+    try:
+        rest = b''
+        while True:
+            data = f.read(2 * blockSize)
+            if not data:
+                break
+            data = rest + data
+            size = len(data) - len(data) % 2
+            rest = data[size:]
+            yield np.frombuffer(data[:size], dtype='<i2').astype(np.float32) / 32768.0
+    finally:
+        if close:
+            f.close()
+
+class FeatureExtractor:
+    # Sliding window FFT features in dB, keeps the samples of the last
+    # incomplete window between blocks.
+
+    def __init__(self, frameSize=32, hopSize=16, numBins=32, window='hamming', dbFloor=-130.0):
+        self.frameSize = frameSize
+        self.hopSize = hopSize
+        self.numBins = numBins
+        self.window = np.hamming(frameSize) if window == 'hamming' else np.ones(frameSize)
+        self.window = self.window.astype(np.float32)
+        self.minMagnitude = 10.0 ** (dbFloor / 20.0)
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    def reset(self):
+        self._rest = np.zeros(0, dtype=np.float32)
+
+    def process(self, block):
+        # Returns the features (numFrames, numBins) of the windows that end
+        # in this block.
+        samples = np.concatenate((self._rest, block))
+        numFrames = 0
+        if len(samples) >= self.frameSize:
+            numFrames = 1 + (len(samples) - self.frameSize) // self.hopSize
+        if numFrames == 0:
+            self._rest = samples
+            return np.zeros((0, self.numBins), dtype=np.float32)
+        windows = np.lib.stride_tricks.sliding_window_view(samples, self.frameSize)[::self.hopSize][:numFrames]
+        spectrum = np.abs(np.fft.fft(windows * self.window, n=max(self.numBins, self.frameSize), axis=1))
+        features = 20.0 * np.log10(np.maximum(spectrum[:, :self.numBins], self.minMagnitude))
+        self._rest = samples[numFrames * self.hopSize:]
+        return features.astype(np.float32)
+
+class RingBuffer:
+    # Preallocated FIFO of feature frames and of their arrival times, when it
+    # is full the oldest frames are dropped.
+
+    def __init__(self, capacity, numFeatures):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity, numFeatures), dtype=np.float32)
+        self.arrival = np.zeros(capacity)
+        self.reset()
+
+    def reset(self):
+        self.head = 0    # Index of the oldest frame.
+        self.size = 0
+        self.numDropped = 0
+
+    def push(self, frames, arrivalTime):
+        n = len(frames)
+        if n > self.capacity:
+            self.numDropped += n - self.capacity
+            frames = frames[n - self.capacity:]
+            n = self.capacity
+        overflow = self.size + n - self.capacity
+        if overflow > 0:
+            self.head = (self.head + overflow) % self.capacity
+            self.size -= overflow
+            self.numDropped += overflow
+        idx = (self.head + self.size + np.arange(n)) % self.capacity
+        self.frames[idx] = frames
+        self.arrival[idx] = arrivalTime
+        self.size += n
+
+    def pop(self, count):
+        # Returns (frames, arrival times) of the count oldest frames (copies).
+        count = min(count, self.size)
+        idx = (self.head + np.arange(count)) % self.capacity
+        self.head = (self.head + count) % self.capacity
+        self.size -= count
+        return self.frames[idx], self.arrival[idx]
+
+class StreamingClassifier:
+    #    stream = StreamingClassifier(topModel, batchSize=8)
+    #    report = stream.run('word.wav')
+    #    print(report['latency_p99_ms'], report['real_time_factor'])
+
+    def __init__(self, model, batchSize=8, frameSkip=0, frameSize=32, hopSize=16,
+                 numBins=32, bufferFrames=1024):
+        self.model = model
+        self.batchSize = batchSize
+        self.frameSkip = frameSkip
+        self.features = FeatureExtractor(frameSize, hopSize, numBins)
+        self.buffer = RingBuffer(bufferFrames, numBins)
+        self.predictions = []
+        self._latencies = []
+        self._frameCount = 0
+        self._clock = 0.0   # Virtual CPU clock, in seconds of audio.
+
+    def _classify(self, count):
+        # Classifies the count oldest frames, returns the processing time.
+        frames, arrival = self.buffer.pop(count)
+        if self.frameSkip > 0:
+            keep = (self._frameCount + np.arange(len(frames))) % (self.frameSkip + 1) == 0
+            self._frameCount += len(frames)
+            frames, arrival = frames[keep], arrival[keep]
+        if len(frames) == 0:
+            return 0.0
+        startTime = time.perf_counter()
+        y_pred = self.model.predict(frames)
+        elapsed = time.perf_counter() - startTime
+        self._clock = max(self._clock, arrival.max()) + elapsed
+        self.predictions.append(y_pred)
+        self._latencies.append(self._clock - arrival)
+        return elapsed
+
+    def _drain(self, untilTime):
+        # Classifies the micro-batches that the CPU starts before untilTime
+        # (the arrival of the next block), returns the processing time.
+        busyTime = 0.0
+        while self.buffer.size >= self.batchSize and self._clock < untilTime:
+            busyTime += self._classify(self.batchSize)
+        return busyTime
+
+    def run(self, source, blockSize=1024, sampleRate=8000, realTime=False):
+        # Processes all the audio of source, returns the report dict.
+        self.features.reset()
+        self.buffer.reset()
+        self.predictions = []
+        self._latencies = []
+        self._frameCount = 0
+        self._clock = 0.0
+        numSamples = 0
+        numFrames = 0
+        busyTime = 0.0
+        startTime = time.perf_counter()
+        for block, sampleRate in iterAudioBlocks(source, blockSize, sampleRate, realTime):
+            numSamples += len(block)
+            arrivalTime = numSamples / float(sampleRate)
+            busyTime += self._drain(arrivalTime)
+            featuresTime = time.perf_counter()
+            frames = self.features.process(block)
+            elapsed = time.perf_counter() - featuresTime
+            self._clock = max(self._clock, arrivalTime) + elapsed
+            busyTime += elapsed
+            numFrames += len(frames)
+            self.buffer.push(frames, arrivalTime)
+        # Flush the frames left in the buffer, the audio has ended.
+        busyTime += self._drain(np.inf)
+        busyTime += self._classify(self.buffer.size)
+        totalTime = time.perf_counter() - startTime
+
+        latencies = np.concatenate(self._latencies) if self._latencies else np.zeros(0)
+        return streamReport(latencies, numSamples, numFrames, self.buffer.numDropped,
+                            sampleRate, busyTime, totalTime)
+
+    def predicted(self):
+        if len(self.predictions) == 0:
+            return np.zeros(0)
+        return np.concatenate(self.predictions)
+
+def streamReport(latencies, numSamples, numFrames, numDropped, sampleRate, busyTime, totalTime):
+    audioTime = numSamples / float(sampleRate)
+    latencies = np.asarray(latencies) * 1000.0
+    if len(latencies) > 0:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        latencyMax = latencies.max()
+    else:
+        p50 = p90 = p99 = latencyMax = np.nan
+    realTimeFactor = audioTime / busyTime if busyTime > 0 else np.inf
+    return {'audio_seconds': audioTime,
+            'num_frames': numFrames,
+            'num_classified': len(latencies),
+            'num_dropped': numDropped,
+            'latency_p50_ms': float(p50),
+            'latency_p90_ms': float(p90),
+            'latency_p99_ms': float(p99),
+            'latency_max_ms': float(latencyMax),
+            'frames_per_second': len(latencies) / busyTime if busyTime > 0 else np.inf,
+            'real_time_factor': realTimeFactor,
+            'total_seconds': totalTime,
+            'keeps_up': bool(realTimeFactor >= 1.0 and numDropped == 0)}
@@ -77,13 +77,27 @@
 # Then I installed the:
 #   [JamesRitchie - scikit-rvm](https://github.com/JamesRitchie/scikit-rvm)  
 # 
+# Phase 3
+# Now the RVM is trained with the fast algorithm (Tipping & Faul 2003 paper)
+# implemented in this project in fast_rvm.py, it's a drop in for skrvm.RVC and
+# it also reports the number of relevance vectors per class.
+#
 
-import numpy as np
+import sys
 from sklearn.utils import shuffle
 from sklearn.svm import SVC
 from sklearn.metrics import accuracy_score
-from io import StringIO   # StringIO behaves like a file object.
-from skrvm import RVC
+# from skrvm import RVC   # Slower 2001 RVM algorithm.
+from fast_rvm import RVC  # Fast 2003 RVM algorithm, see fast_rvm.py.
+from svm_sweep import SVMGammaSweep
+from rvm_sweep import RVMGammaSweep
+from search_strategy import selectTop
+from dataset import loadDataset
+from export_c import VARIANTS, quantizeModel, writeC, exportReport
+from reduced_set import reduceSVM, compressionReport
+from cross_validation import CrossValidation
+from streaming import StreamingClassifier, synthAudio
+from approx_kernel import ApproxKernelSweep, inferenceCost
 
 dataset = '''
 // 1
@@ -151,108 +165,142 @@ def printDataSetTestVsPred(model, X_test):
     print("y_test:  ", y_test)
     print("y_pred:  ", y_pred)
 
-def genBestSVM(X_train, y_train, X_test, y_test):
-    topModel    = None
-    topAccTrain = 0
-    topAccTest  = 0
-    topGamma    = 0
-    topNumSupportVecPerClass = 0
- 
+def _checkResults(genName, results, strategy):
+    # A search strategy without results (no budget left) has no top model.
+    if len(results) == 0:
+        raise ValueError("{0}: the search strategy {1} returned no results (budget {2}).".format(
+            genName, type(strategy).__name__, strategy.budget))
+
+def genBestSVM(X_train, y_train, X_test, y_test, numWorkers=None, strategy=None,
+               gammaRange=(0.000001, 0.000999)):
     # Because the dataset is small, model generation is fast, so we can
     # generate and search in 1000 models with different gamma's.
-    for i in range(1, 1000):  # 1000
-        # clf = SVC(kernel='linear').fit(X_train, y_train)
-        # clf = SVC(kernel='linear', gamma=0.001).fit(X_train, y_train)
-        gammaVal = 0.000001 * i
-        clf = SVC(kernel='rbf', gamma=gammaVal).fit(X_train, y_train) 
-    
-        numSupportVectors = clf.n_support_  # Per Class
-
-        y_pred = clf.predict(X_train)
-        accTrain = accuracy_score(y_train, y_pred)
-
-        y_pred = clf.predict(X_test)
-        accTest = accuracy_score(y_test, y_pred)
-        
-        print("SVM: gamma_val: {0:.6f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
-            gammaVal, accTrain, accTest, numSupportVectors))
-
-        # We want a small difference between the train accuracy and the
-        # test accuracy, so that neither one is overfitting,
-        # while maximizing the absolute train value.
-        deltaCurr = abs(accTrain - accTest)
-        if (topModel == None) or (deltaCurr < 0.1 and topAccTrain < accTrain): 
-            topAccTrain = accTrain
-            topAccTest  = accTest
-            topModel = clf
-            topGamma = gammaVal
-            topNumSupportVecPerClass = numSupportVectors  # Per class.
+    # The squared distances are computed only once and the gamma's are
+    # fitted with a precomputed kernel in a pool of numWorkers processes
+    # (None uses all the cores, 1 is the serial path).
+    # If a search strategy is given (see search_strategy.py) the gamma's
+    # are chosen by the strategy inside gammaRange, with it's fit budget.
+    with SVMGammaSweep(X_train, y_train, X_test, y_test, numWorkers=numWorkers) as sweep:
+
+        def evaluate(gammaVals, trainIdx=None):
+            results = sweep.run(gammaVals, trainIdx)
+            if trainIdx is None:
+                for gammaVal, accTrain, accTest, numSupportVectors, clf in results:
+                    print("SVM: gamma_val: {0:.6f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
+                        gammaVal, accTrain, accTest, numSupportVectors))
+            return results
+
+        if strategy is None:
+            results = evaluate([0.000001 * i for i in range(1, 1000)])  # 1000
+        else:
+            results = strategy.search(evaluate, gammaRange[0], gammaRange[1], y_train)
+            _checkResults('genBestSVM', results, strategy)
+            results = sorted(results, key=lambda r: r[0])
+
+    # We want a small difference between the train accuracy and the
+    # test accuracy, so that neither one is overfitting,
+    # while maximizing the absolute train value.
+    topGamma, topAccTrain, topAccTest, topNumSupportVecPerClass, topModel = selectTop(results)
 
     return (topModel, topAccTrain, topAccTest, topGamma, topNumSupportVecPerClass)
 
-def genBestRVM(X_train, y_train, X_test, y_test):
-    topModel    = None
-    topAccTrain = 0
-    topAccTest  = 0
-    topAlpha    = 0
-    topNumSupportVecPerClass = 0
- 
-    alphaVal = 0.00000001
-    # Because the dataset is small, model generation is fast, so we can
-    # generate and search in 12 models with different alpha's.
-    for i in range(1, 13):
-        alphaVal *= 5
-        # alphaVal = 0.000001
-        clf = RVC(kernel='rbf', alpha=alphaVal).fit(X_train, y_train) 
+def genBestRVM(X_train, y_train, X_test, y_test, strategy=None,
+               gammaRange=(0.000001, 0.002048), kernelCache=None, warmStart=True):
+    # The alpha of the fast RVC is only the initial precision of the bias, the
+    # model is selected with the gamma of the RBF kernel (see fast_rvm.py).
+    # All the fits share a kernel matrix cache and each fit starts from the
+    # previous converged model (see rvm_sweep.py).
+    sweep = RVMGammaSweep(X_train, y_train, X_test, y_test,
+                          kernelCache=kernelCache, warmStart=warmStart)
 
-        # Relevance Vectors
-        numSupportVectors = [] # Per class
+    def evaluate(gammaVals, trainIdx=None):
+        results = sweep.run(gammaVals, trainIdx)
+        if trainIdx is None:
+            for gammaVal, accTrain, accTest, numSupportVectors, clf in results:
+                print("RVM: gamma_val: {0:.6f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
+                    gammaVal, accTrain, accTest, numSupportVectors))
 
-        y_pred = clf.predict(X_train)
-        accTrain = accuracy_score(y_train, y_pred)
+                printDataSetTestVsPred(clf, X_test)
+        return results
 
-        y_pred = clf.predict(X_test)
-        accTest = accuracy_score(y_test, y_pred)
-        
-        print("RVM: alpha_val: {0:.8f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
-            alphaVal, accTrain, accTest, numSupportVectors))
+    if strategy is None:
+        # Because the dataset is small, model generation is fast, so we can
+        # generate and search in 12 models with different gamma's.
+        gammaVals = []
+        gammaVal = 0.0000005
+        for i in range(1, 13):
+            gammaVal *= 2
+            gammaVals.append(gammaVal)
+        results = evaluate(gammaVals)
+    else:
+        results = strategy.search(evaluate, gammaRange[0], gammaRange[1], y_train)
+        _checkResults('genBestRVM', results, strategy)
+        results = sorted(results, key=lambda r: r[0])
 
-        printDataSetTestVsPred(clf, X_test)
+    cacheStats = sweep.cacheStats()
+    print("RVM: kernel_cache hits: {0}   misses: {1}   iterations_per_fit: {2}".format(
+        cacheStats['hits'], cacheStats['misses'], [n.tolist() for a, n in sweep.iterations]))
 
-        # We want a small difference between the train accuracy and the
-        # test accuracy, so that neither one is overfitting,
-        # while maximizing the absolute train value.
-        deltaCurr = abs(accTrain - accTest)
-        if (topModel == None) or (deltaCurr < 0.1 and topAccTrain < accTrain): 
-            topAccTrain = accTrain
-            topAccTest  = accTest
-            topModel = clf
-            topAlpha = alphaVal
-            topNumSupportVecPerClass = numSupportVectors  # Per class.
+    # We want a small difference between the train accuracy and the
+    # test accuracy, so that neither one is overfitting,
+    # while maximizing the absolute train value.
+    topGamma, topAccTrain, topAccTest, topNumSupportVecPerClass, topModel = selectTop(results)
+
+    return (topModel, topAccTrain, topAccTest, topGamma, topNumSupportVecPerClass)
 
-    return (topModel, topAccTrain, topAccTest, topAlpha, topNumSupportVecPerClass)
+def genBestApprox(X_train, y_train, X_test, y_test, method='rff', numComponents=32,
+                  strategy=None, gammaRange=(0.000001, 0.000999)):
+    # Random Fourier Features or Nystroem feature map with numComponents
+    # components plus a linear SVM (see approx_kernel.py), with the same
+    # gamma sweep and selection of genBestSVM but without per fit print lines.
+    sweep = ApproxKernelSweep(X_train, y_train, X_test, y_test, method=method,
+                              numComponents=numComponents)
+    if strategy is None:
+        results = sweep.run([0.000001 * i for i in range(1, 1000)])  # 1000
+    else:
+        results = strategy.search(sweep.run, gammaRange[0], gammaRange[1], y_train)
+        _checkResults('genBestApprox', results, strategy)
+        results = sorted(results, key=lambda r: r[0])
 
+    topGamma, topAccTrain, topAccTest, topNumComponents, topModel = selectTop(results)
+
+    return (topModel, topAccTrain, topAccTest, topGamma, topNumComponents)
+
+def genBestSVMCV(cv, X_train, y_train, gammaVals=None):
+    # The gamma is selected with the mean of the accuracies in the folds of
+    # the CrossValidation cv (see cross_validation.py), without per fit print
+    # lines, then the top model is fitted in all the train dataset.
+    if gammaVals is None:
+        gammaVals = [0.000001 * i for i in range(1, 1000)]  # 1000
+    results = cv.svm(gammaVals)
+    top = results.select()
+    topGamma = results.paramVals[top]
+    topModel = SVC(kernel='rbf', gamma=topGamma).fit(X_train, y_train)
+    return (topModel, results.meanAccTrain()[top], results.meanAccTest()[top], topGamma,
+            results.numVectors[:, top].mean(axis=0), results)
+
+def genBestRVMCV(cv, X_train, y_train, gammaVals=None):
+    # Like genBestSVMCV(), each fold is a warm started sweep of the gamma's.
+    if gammaVals is None:
+        gammaVals = [0.000001 * 2 ** i for i in range(12)]
+    results = cv.rvm(gammaVals)
+    top = results.select()
+    topGamma = results.paramVals[top]
+    topModel = RVC(kernel='rbf', coef1=topGamma).fit(X_train, y_train)
+    return (topModel, results.meanAccTrain()[top], results.meanAccTest()[top], topGamma,
+            results.numVectors[:, top].mean(axis=0), results)
 
 if __name__ == '__main__':
     
-    strFinal = ""
-    for line in dataset.splitlines():
-        if len(line) == 0:
-            pass
-        elif len(line) == 4:
-            y_curr = int(line[3])
-        elif len(line) > 10:
-          strFinal += str(y_curr) + "," + line + "\n"
-
-    c = StringIO(strFinal)
-    data = np.loadtxt(c, delimiter=',', usecols=range(33))
+    # Parse the dataset in chunks, see dataset.py. For big external dataset
+    # files use loadDataset(fileName, cacheDir='cache') so that the next runs
+    # load a memory mapped binary cache instead of parsing the text again,
+    # and dtype=numpy.float32 to use half of the memory.
+    X, y = loadDataset(dataset)
 
     # Total number of features: 32
     # Total number of cases in all classes: 16 + 16 + 20
 
-    X = data[:, 1:]  # select columns 1 through end
-    y = data[:, 0]   # select column 0, the class
-
     data, target = shuffle(X, y, random_state = 0) # 0 # 2   
     
     X_train, X_test = data[:-10, :], data[-10:, :] # 10
@@ -270,12 +318,26 @@ if __name__ == '__main__':
     print("y_test:  ", y_test)
     print("y_pred:  ", y_pred)
 
+    svmTopModel = topModel
+
+    #######
+    # Compress the best SVM with a reduced set of vectors (see reduced_set.py),
+    # the smallest one without a drop of the train accuracy.
+
+    svmReducedModel = reduceSVM(svmTopModel, X_train, method='greedy', maxAccDrop=0.0,
+                                X_val=X_train, y_val=y_train)
+    report = compressionReport(svmTopModel, svmReducedModel, X_test, y_test)
+    print("\nSVM: reduced_set num_vectors: {0} --> {1}   acc_X_test: {2:.3f} --> {3:.3f}   size_reduction: {4:.1%}   speed_up: {5:.1f}x".format(
+        report['num_vectors'], report['num_vectors_reduced'], report['acc'], report['acc_reduced'],
+        report['size_reduction'], report['macs_speed_up']))
+    printDataSetTestVsPred(svmReducedModel, X_test)
+
     #######
-    # Generate the best RVM optimizing the alpha hyper-parameter.
+    # Generate the best RVM optimizing the gamma hyper-parameter.
 
-    topModel, topAccTrain, topAccTest, topAlpha, topNumSupportVecPerClass = genBestRVM(X_train, y_train, X_test, y_test)
-    print("\nRVM: top_alpha: {0:.6f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
-        topAlpha, topAccTrain, topAccTest, topNumSupportVecPerClass))
+    topModel, topAccTrain, topAccTest, topGamma, topNumSupportVecPerClass = genBestRVM(X_train, y_train, X_test, y_test)
+    print("\nRVM: top_gamma: {0:.6f}    acc_X_train: {1:.3f}   acc_X_test: {2:.3f}   num_support_vectors: {3}".format(
+        topGamma, topAccTrain, topAccTest, topNumSupportVecPerClass))
     
     # Here just to compare to see if the 3 classes were present in the target test dataset.
     # y_pred = topModel.predict(X_test)
@@ -284,5 +346,82 @@ if __name__ == '__main__':
 
     printDataSetTestVsPred(topModel, X_test)
 
+    rvmTopModel = topModel
+
+    #######
+    # Generate the best approximate kernel models (Random Fourier Features and
+    # Nystroem, see approx_kernel.py) optimizing the gamma, their inference
+    # cost is fixed by the number of components, and compare the cost of all
+    # the models (float32 parameters).
+
+    print()
+    approxTopModels = []
+    for method in ('rff', 'nystroem'):
+        topModel, topAccTrain, topAccTest, topGamma, topNumComponents = genBestApprox(X_train, y_train, X_test, y_test, method=method)
+        print("{0}: top_gamma: {1:.6f}    acc_X_train: {2:.3f}   acc_X_test: {3:.3f}   num_components: {4}".format(
+            method.upper(), topGamma, topAccTrain, topAccTest, topNumComponents))
+        printDataSetTestVsPred(topModel, X_test)
+        approxTopModels.append((method, topModel))
+    nystroemTopModel = approxTopModels[1][1]
+
+    print()
+    for modelName, model in [('svm', svmTopModel), ('svm_reduced', svmReducedModel), ('rvm', rvmTopModel)] + approxTopModels:
+        cost = inferenceCost(model)
+        print("{0}: cost  acc_X_test: {1:.3f}   num_vectors: {2}   param_bytes: {3}   macs_per_inference: {4}   exp_or_cos_per_inference: {5}".format(
+            modelName.upper(), accuracy_score(y_test, model.predict(X_test)), cost['num_vectors'],
+            cost['param_bytes'], cost['macs_per_inference'], cost['nonlinear_per_inference']))
+
+    #######
+    # The same selection with a 5 fold stratified cross validation repeated
+    # 2 times in the train dataset (see cross_validation.py), the accuracies
+    # are the means in the folds, the kernels of the folds are slices of one
+    # distance matrix and the SVM and the RVM share the pool of processes.
+
+    print()
+    with CrossValidation(X_train, y_train, numFolds=5, numRepeats=2) as cv:
+        topModel, topAccTrain, topAccTest, topGamma, topNumSupportVecPerClass, cvResults = genBestSVMCV(cv, X_train, y_train)
+        print("SVM: cv top_gamma: {0:.6f}    mean_acc_train: {1:.3f}   mean_acc_test: {2:.3f}   std_acc_test: {3:.3f}   num_support_vectors: {4}".format(
+            topGamma, topAccTrain, topAccTest, cvResults.accTest[:, cvResults.select()].std(), topNumSupportVecPerClass))
+        printDataSetTestVsPred(topModel, X_test)
+
+        topModel, topAccTrain, topAccTest, topGamma, topNumSupportVecPerClass, cvResults = genBestRVMCV(cv, X_train, y_train)
+        print("RVM: cv top_gamma: {0:.6f}    mean_acc_train: {1:.3f}   mean_acc_test: {2:.3f}   std_acc_test: {3:.3f}   num_support_vectors: {4}".format(
+            topGamma, topAccTrain, topAccTest, cvResults.accTest[:, cvResults.select()].std(), topNumSupportVecPerClass))
+        printDataSetTestVsPred(topModel, X_test)
+
+    #######
+    # Export the best SVM and the best RVM to C for the micro-controller, in
+    # the int8, int16 and float32 variants (see export_c.py). The accuracy
+    # is the one of the NumPy emulator of the C code in all the dataset.
+
+    print()
+    for modelName, model in (('svm', svmTopModel), ('svm_reduced', svmReducedModel), ('rvm', rvmTopModel),
+                             ('nystroem', nystroemTopModel)):
+        for variant in VARIANTS:
+            qModel = quantizeModel(model, variant, X_calib=X_train)
+            writeC(qModel, modelName + '_' + variant, 'export')
+            report = exportReport(model, qModel, X, y)
+            print("{0}: C {1:7s}  acc_X_float: {2:.3f}   acc_X_quant: {3:.3f}   flash_bytes: {4}   ram_bytes: {5}   macs_per_inference: {6}".format(
+                modelName.upper(), variant, report['acc_float'], report['acc_quant'],
+                report['flash_bytes'], report['ram_bytes'], report['macs_per_inference']))
+
+    #######
+    # Streaming inference of the best models (see streaming.py), the audio is
+    # the WAV or raw PCM file given in the command line ('-' is a pipe in the
+    # standard input), or else 10 seconds of synthetic audio. The latency is
+    # in the virtual clock of the audio (see streaming.py), the frames that
+    # wait for the next block to fill a micro-batch have a latency of about
+    # one block (128 ms).
+
+    audioSource = sys.argv[1] if len(sys.argv) > 1 else synthAudio(seconds=10.0)
+    print()
+    for modelName, model in [('svm', svmTopModel), ('svm_reduced', svmReducedModel), ('rvm', rvmTopModel)] + approxTopModels:
+        report = StreamingClassifier(model, batchSize=8).run(audioSource)
+        print("{0}: stream frames: {1}   dropped: {2}   latency_ms p50: {3:.3f}   p90: {4:.3f}   p99: {5:.3f}   frames_per_second: {6:.0f}   real_time_factor: {7:.1f}   keeps_up: {8}".format(
+            modelName.upper(), report['num_frames'], report['num_dropped'], report['latency_p50_ms'], report['latency_p90_ms'],
+            report['latency_p99_ms'], report['frames_per_second'], report['real_time_factor'], report['keeps_up']))
+        if isinstance(audioSource, str) and audioSource == '-':
+            break  # A pipe can only be read once.
+
     print("...end")
 
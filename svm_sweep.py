@@ -0,0 +1,207 @@
+###############################################################################
+#                                 svm_sweep.py
+#
+# Precomputed distance, process parallel gamma sweep for the RBF SVM.
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The RBF kernel is exp(-gamma * ||x - z||^2), so for a fixed
+#              train and test dataset the squared distances are the same for
+#              every gamma. Here we compute the train x train and test x train
+#              squared distance matrices only once, and then each candidate
+#              gamma is fitted with a precomputed kernel exp(-gamma * D).
+#
+#              The gamma grid is spread over a pool of worker processes. The
+#              distance matrices are sent to each worker only once (in the
+#              pool initializer) and the results come back in the same order
+#              of the grid, so the selection of the best model is exactly the
+#              same as in the serial path (numWorkers = 1).
+#
+#              The winning model is wrapped in a PrecomputedRBFSVC so that it
+#              can be used like a normal SVC, model.predict(X_test).
+###############################################################################
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.svm import SVC
+from sklearn.metrics import accuracy_score
+from profiling import phase
+
+def squaredDistanceMatrix(A, B):
+    # ||a - b||^2 = a.a + b.b - 2 a.b , this is the same expansion that
+    # libsvm uses internally for the RBF kernel.
+    A = np.asarray(A, dtype=np.float64)
+    B = np.asarray(B, dtype=np.float64)
+    aa = np.einsum('ij,ij->i', A, A)
+    bb = np.einsum('ij,ij->i', B, B)
+    D = aa[:, None] + bb[None, :] - 2.0 * np.dot(A, B.T)
+    # Rounding can give very small negative numbers.
+    np.maximum(D, 0.0, out=D)
+    return D
+
+class PrecomputedRBFSVC:
+    # Wraps a SVC(kernel='precomputed') trained on exp(-gamma * D) so that
+    # it behaves like a SVC(kernel='rbf', gamma=gamma) for predict().
+    # It exposes the same fitted attributes as the sklearn SVC, with the
+    # support_vectors_ taken from the train dataset. Only the support
+    # vectors are kept, libsvm only reads their columns of the precomputed
+    # kernel, so the predict is O(n_SV) and not O(N_train).
+
+    def __init__(self, svc, gamma, X_train):
+        self.svc   = svc
+        self.gamma = gamma
+        self.kernel  = 'rbf'
+        self.numTrain = len(X_train)
+        self._supportVectors = np.asarray(X_train, dtype=np.float64)[svc.support_]
+
+    @property
+    def classes_(self):
+        return self.svc.classes_
+
+    @property
+    def n_support_(self):
+        return self.svc.n_support_
+
+    @property
+    def support_(self):
+        return self.svc.support_
+
+    @property
+    def support_vectors_(self):
+        return self._supportVectors
+
+    @property
+    def dual_coef_(self):
+        return self.svc.dual_coef_
+
+    @property
+    def intercept_(self):
+        return self.svc.intercept_
+
+    def _kernel(self, X):
+        # (n, N_train) kernel with only the columns of the support vectors.
+        X = np.asarray(X, dtype=np.float64)
+        K = np.zeros((X.shape[0], self.numTrain))
+        K[:, self.svc.support_] = np.exp(-self.gamma * squaredDistanceMatrix(X, self._supportVectors))
+        return K
+
+    def decision_function(self, X):
+        return self.svc.decision_function(self._kernel(X))
+
+    def predict(self, X):
+        return self.svc.predict(self._kernel(X))
+
+# Worker process state, filled once by the pool initializer so that the
+# distance matrices are not pickled again for each task.
+_workerState = {}
+
+def _initWorker(D_train, D_test, y_train, y_test, svcParams):
+    _workerState['D_train'] = D_train
+    _workerState['D_test']  = D_test
+    _workerState['y_train'] = y_train
+    _workerState['y_test']  = y_test
+    _workerState['svcParams'] = svcParams
+
+def _fitGammaCandidate(gammaVal, D_train, D_test, y_train, y_test, svcParams):
+    K_train = np.exp(-gammaVal * D_train)
+    clf = SVC(kernel='precomputed', **svcParams).fit(K_train, y_train)
+
+    numSupportVectors = clf.n_support_  # Per Class
+
+    y_pred = clf.predict(K_train)
+    accTrain = accuracy_score(y_train, y_pred)
+
+    y_pred = clf.predict(np.exp(-gammaVal * D_test))
+    accTest = accuracy_score(y_test, y_pred)
+
+    return (gammaVal, accTrain, accTest, numSupportVectors, clf)
+
+def _subsetDistances(D_train, D_test, y_train, trainIdx):
+    # The distances of a subset of the train dataset are just a slice of
+    # the full matrices.
+    if trainIdx is None:
+        return D_train, D_test, y_train
+    return D_train[np.ix_(trainIdx, trainIdx)], D_test[:, trainIdx], y_train[trainIdx]
+
+def _fitGammaChunk(gammaVals, trainIdx=None):
+    s = _workerState
+    D_train, D_test, y_train = _subsetDistances(s['D_train'], s['D_test'], s['y_train'], trainIdx)
+    return [_fitGammaCandidate(gammaVal, D_train, D_test,
+                               y_train, s['y_test'], s['svcParams'])
+            for gammaVal in gammaVals]
+
+def defaultNumWorkers():
+    return os.cpu_count() or 1
+
+class SVMGammaSweep:
+    # Holds the precomputed distance matrices of one train / test split and
+    # a (lazily created) pool of worker processes. It can be used as a
+    # context manager so that the pool is closed at the end.
+    #
+    #    with SVMGammaSweep(X_train, y_train, X_test, y_test, numWorkers=4) as sweep:
+    #        results = sweep.run(gammaVals)
+    #
+    # Each result is a tuple (gamma, accTrain, accTest, numSupportVectors, model)
+    # in the same order of gammaVals. trainIdx optionally selects a subset of
+    # the train dataset (used by the successive halving search strategy).
+
+    def __init__(self, X_train, y_train, X_test, y_test, numWorkers=1,
+                 chunkSize=None, **svcParams):
+        self.X_train = np.asarray(X_train, dtype=np.float64)
+        self.y_train = np.asarray(y_train)
+        self.y_test  = np.asarray(y_test)
+        with phase('svm.distances'):
+            self.D_train = squaredDistanceMatrix(self.X_train, self.X_train)
+            self.D_test  = squaredDistanceMatrix(X_test, self.X_train)
+        self.numWorkers = defaultNumWorkers() if numWorkers is None else max(1, int(numWorkers))
+        self.chunkSize  = chunkSize
+        self.svcParams  = svcParams
+        self._pool = None
+
+    def _getPool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.numWorkers, initializer=_initWorker,
+                initargs=(self.D_train, self.D_test, self.y_train,
+                          self.y_test, self.svcParams))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def run(self, gammaVals, trainIdx=None):
+        with phase('svm.fits'):
+            return self._run(gammaVals, trainIdx)
+
+    def _run(self, gammaVals, trainIdx):
+        gammaVals = [float(g) for g in gammaVals]
+        X_train = self.X_train if trainIdx is None else self.X_train[trainIdx]
+        if self.numWorkers == 1 or len(gammaVals) <= 1:
+            D_train, D_test, y_train = _subsetDistances(self.D_train, self.D_test,
+                                                        self.y_train, trainIdx)
+            results = [_fitGammaCandidate(gammaVal, D_train, D_test,
+                                          y_train, self.y_test, self.svcParams)
+                       for gammaVal in gammaVals]
+        else:
+            # A few chunks per worker, to balance the load between the
+            # small gammas (many support vectors) and the big ones.
+            chunkSize = self.chunkSize
+            if chunkSize is None:
+                chunkSize = max(1, len(gammaVals) // (4 * self.numWorkers))
+            chunks = [gammaVals[i:i + chunkSize] for i in range(0, len(gammaVals), chunkSize)]
+            results = []
+            for chunkResults in self._getPool().map(_fitGammaChunk, chunks,
+                                                    [trainIdx] * len(chunks)):
+                results.extend(chunkResults)
+
+        return [(gammaVal, accTrain, accTest, numSupportVectors,
+                 PrecomputedRBFSVC(clf, gammaVal, X_train))
+                for (gammaVal, accTrain, accTest, numSupportVectors, clf) in results]
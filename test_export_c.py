@@ -0,0 +1,45 @@
+###############################################################################
+#                               test_export_c.py
+#
+# Tests of the kernel expansion form of the models (pytest).
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The float reference kernelExpansion(model), that the C exporter
+#              quantizes, must predict the same as the model it comes from,
+#              for binary and multiclass SVC (one-vs-one) and RVC
+#              (one-vs-rest).
+#
+#              Run with: python -m pytest -q
+###############################################################################
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_blobs
+from sklearn.svm import SVC
+from fast_rvm import RVC
+from svm_sweep import PrecomputedRBFSVC, squaredDistanceMatrix
+from export_c import kernelExpansion
+
+GAMMA = 0.5
+
+def _dataset(numClasses):
+    X, y = make_blobs(n_samples=180, centers=numClasses, n_features=4,
+                      cluster_std=2.5, random_state=numClasses)
+    return X[:120], y[:120], X[120:]
+
+def _svc(X_train, y_train):
+    return SVC(kernel='rbf', gamma=GAMMA, C=1.0).fit(X_train, y_train)
+
+def _precomputedSVC(X_train, y_train):
+    K = np.exp(-GAMMA * squaredDistanceMatrix(X_train, X_train))
+    return PrecomputedRBFSVC(SVC(kernel='precomputed', C=1.0).fit(K, y_train), GAMMA, X_train)
+
+def _rvc(X_train, y_train):
+    return RVC(kernel='rbf', coef1=GAMMA).fit(X_train, y_train)
+
+@pytest.mark.parametrize('numClasses', [2, 3])
+@pytest.mark.parametrize('makeModel', [_svc, _precomputedSVC, _rvc])
+def test_kernel_expansion_predicts_like_the_model(makeModel, numClasses):
+    X_train, y_train, X_test = _dataset(numClasses)
+    model = makeModel(X_train, y_train)
+    np.testing.assert_array_equal(kernelExpansion(model).predict(X_test), model.predict(X_test))
@@ -0,0 +1,87 @@
+###############################################################################
+#                               test_fast_rvm.py
+#
+# Tests of the fast RVM classifier (pytest).
+###############################################################################
+# Author: Joao Nuno Carvalho
+# Description: The rank one updates of the inner loop of RVC._fitBinary()
+#              (Tipping & Faul 2003, appendix) are checked against S and Q
+#              computed from scratch, with the alphas after each action and
+#              B = diag(beta) and e = B t_hat of the last Laplace
+#              approximation:
+#
+#                 Sigma = (A + Phi_a' B Phi_a)^-1,   G = Phi' B Phi_a
+#                 S     = diag(Phi' B Phi) - diag(G Sigma G')
+#                 Q     = Phi' e - G Sigma Phi_a' e
+#
+#              And that kernel='precomputed' gives the same predictions as
+#              kernel='rbf' with the same gamma.
+#
+#              Run with: python -m pytest -q
+###############################################################################
+
+import numpy as np
+from sklearn.datasets import make_moons
+from svm_sweep import squaredDistanceMatrix
+from fast_rvm import RVC
+
+GAMMA = 2.0
+
+def _dataset(numSamples=120, seed=0):
+    X, y = make_moons(n_samples=numSamples, noise=0.3, random_state=seed)
+    return X, y
+
+def _freshFactors(Phi, beta, e, alpha):
+    # S and Q from scratch for the active basis (finite alpha).
+    active = np.flatnonzero(np.isfinite(alpha))
+    Phi_a = Phi[:, active]
+    G = np.dot(Phi.T, Phi_a * beta[:, None])
+    Sigma = np.linalg.inv(np.diag(alpha[active]) + G[active])
+    S = np.dot(beta, Phi * Phi) - np.sum(np.dot(G, Sigma) * G, axis=1)
+    Q = np.dot(Phi.T, e) - np.dot(G, np.dot(Sigma, np.dot(Phi_a.T, e)))
+    return S, Q
+
+def test_incremental_factors_match_recomputation():
+    X, y = _dataset()
+    rvc = RVC(kernel='rbf', coef1=GAMMA)
+    Phi = rvc._designMatrix(X)
+    t = (y == 1).astype(np.float64)
+
+    # Records B and e of each Laplace approximation and S, Q and the alphas
+    # seen by each action.
+    laplace = {}
+    steps = []
+    posterior, bestAction = rvc._posterior, rvc._bestAction
+
+    def spyPosterior(Phi_a, t, A, mu):
+        mu, Sigma, y, beta = posterior(Phi_a, t, A, mu)
+        laplace['beta'] = beta
+        laplace['e'] = beta * np.dot(Phi_a, mu) + (t - y)
+        return mu, Sigma, y, beta
+
+    def spyBestAction(S, Q, alpha, numActive, numDeletions):
+        result = bestAction(S, Q, alpha, numActive, numDeletions)
+        steps.append((S.copy(), Q.copy(), alpha.copy(), laplace['beta'], laplace['e'],
+                      result[1]))
+        return result
+
+    rvc._posterior, rvc._bestAction = spyPosterior, spyBestAction
+    rvc._fitBinary(Phi, t)
+
+    # The updates of the action chosen in a step are checked in the next one.
+    actions = set(step[5] for step in steps[:-1])
+    assert {'add', 'reestimate', 'delete'} <= actions
+    for S, Q, alpha, beta, e, _ in steps:
+        freshS, freshQ = _freshFactors(Phi, beta, e, alpha)
+        np.testing.assert_allclose(S, freshS, rtol=1e-6, atol=1e-8 * np.abs(freshS).max())
+        np.testing.assert_allclose(Q, freshQ, rtol=1e-6, atol=1e-8 * np.abs(freshQ).max())
+
+def test_precomputed_kernel_matches_rbf():
+    X, y = _dataset(numSamples=200, seed=1)
+    X_train, y_train, X_test = X[:150], y[:150], X[150:]
+    rbf = RVC(kernel='rbf', coef1=GAMMA).fit(X_train, y_train)
+    pre = RVC(kernel='precomputed').fit(np.exp(-GAMMA * squaredDistanceMatrix(X_train, X_train)),
+                                        y_train)
+    K_test = np.exp(-GAMMA * squaredDistanceMatrix(X_test, X_train))
+    np.testing.assert_array_equal(pre.predict(K_test), rbf.predict(X_test))
+    np.testing.assert_allclose(pre.decision_function(K_test), rbf.decision_function(X_test))